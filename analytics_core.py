@@ -0,0 +1,330 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import session
+from psycopg2 import OperationalError
+from psycopg2.extras import Json, execute_values
+
+from db import PoolTimeout, get_db
+from sketches import HyperLogLog, RingBuffer, TopK
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyticsSketches:
+    """Constant-memory, thread-safe view of recent traffic
+
+    Kept per process next to the Postgres store: a ring buffer of the latest
+    events, a HyperLogLog of distinct users and Count-Min heavy hitters for the
+    most viewed pages, most searched courses and most common searches.
+    """
+
+    def __init__(self, recent_size=100, top_k=10):
+        self.recent = RingBuffer(recent_size)
+        self.users = HyperLogLog()
+        self.top_pages = TopK(top_k)
+        self.top_courses = TopK(top_k)
+        self.top_searches = TopK(top_k)
+
+    def update(self, batch):
+        for kind, record in batch:
+            try:
+                self._add(kind, record)
+            except Exception as e:
+                # One malformed record must not cost the rest of the batch
+                logger.warning(f"Skipping {kind} event in analytics sketches: {e}")
+
+    def _add(self, kind, record):
+        if record['user_id']:
+            self.users.add(record['user_id'])
+
+        if kind == 'view':
+            label = record['page']
+            self.top_pages.add(label)
+        elif kind == 'search':
+            params = record['params']
+            label = _search_key(params)
+            if label:
+                self.top_searches.add(label)
+            if params.get('course'):
+                self.top_courses.add(params['course'])
+        elif kind == 'upload':
+            label = record['file_info'].get('course', '')
+        else:
+            label = record['event_type']
+
+        # Keep recent events compact and free of personal details
+        self.recent.append((kind, record['timestamp'].isoformat(), label))
+
+    def summary(self, recent=20):
+        return {
+            'approx_distinct_users': self.users.count(),
+            'top_pages': self.top_pages.top(),
+            'top_courses': self.top_courses.top(),
+            'top_searches': self.top_searches.top(),
+            'recent_events': [
+                {'kind': kind, 'timestamp': timestamp, 'label': label}
+                for kind, timestamp, label in self.recent.snapshot()[-recent:]
+            ]
+        }
+
+
+def _search_key(params):
+    """Normalized text describing a search, used to count the most common ones"""
+    parts = [params.get('q', '')]
+    parts += [params.get(key, '') for key in ('course', 'file_type', 'semester', 'year')]
+    parts += params.get('profs') or []
+    return ' | '.join(str(part).strip().lower() for part in parts if part)
+
+
+class AnalyticsQueue:
+    """Bounded in-process event queue with a batched Postgres writer
+
+    Request handlers only pay for a ``put_nowait``. A background flusher thread
+    collects events and writes them with one multi-row INSERT per table once
+    ``batch_size`` events are buffered or ``flush_interval`` seconds have passed
+    since the first one, updating the pre-aggregated ``analytics_counters`` in
+    the same transaction. When the queue is full new events are dropped and
+    counted rather than blocking the request.
+    """
+
+    def __init__(self, maxsize=10000, batch_size=500, flush_interval=1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.failed = 0
+        self.sketches = AnalyticsSketches()
+        self._queue = queue.Queue(maxsize)
+        self._stats_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._app = None
+
+    def init_app(self, app):
+        """Write through the app's connection pool"""
+        self._app = app
+
+    def enqueue(self, kind, record):
+        """Queue an event without blocking; returns False if it was dropped"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((kind, record))
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+
+    def flush(self):
+        """Write every queued event now, on the calling thread"""
+        batch = []
+        while len(batch) < self._queue.maxsize:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        # Threads don't survive a fork, so a pre-forking server needs one per worker
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='analytics-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+
+            # Keep collecting until the batch is full or the flush interval is up
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._write(batch)
+
+    def _write(self, batch):
+        """Persist a batch of events, logging and counting failures"""
+        try:
+            self.sketches.update(batch)
+        except Exception as e:
+            logger.error(f"Failed to update analytics sketches: {e}")
+
+        if self._app is None or self._app.config.get('CONNECTION_POOL') is None:
+            with self._stats_lock:
+                self.failed += len(batch)
+            logger.error(f"Dropping {len(batch)} analytics events: no connection pool")
+            return
+
+        self._store(batch)
+
+    def _store(self, batch):
+        """Write a batch, halving it on bad data so one event can't sink the rest"""
+        try:
+            with self._app.config['CONNECTION_POOL'].connection() as conn:
+                write_batch(conn.cursor(), batch)
+        except Exception as e:
+            # Smaller chunks won't help when the database itself is unreachable
+            if len(batch) > 1 and not isinstance(e, (OperationalError, PoolTimeout)):
+                middle = len(batch) // 2
+                self._store(batch[:middle])
+                self._store(batch[middle:])
+                return
+            with self._stats_lock:
+                self.failed += len(batch)
+            logger.error(f"Failed to write {len(batch)} analytics events: {e}")
+
+    def summary(self):
+        """Pre-aggregated counters for the admin dashboard"""
+        self.flush()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT metric, key, count FROM analytics_counters')
+            rows = cursor.fetchall()
+
+        counts = Counter()
+        page_views = {}
+        for metric, key, count in rows:
+            if metric == 'page_views':
+                page_views[key] = count
+            counts[metric] += count
+
+        summary = {
+            'page_views': page_views,
+            'user_count': counts['users'],
+            'search_count': counts['searches'],
+            'upload_count': counts['uploads'],
+            'event_count': counts['events'],
+            'dropped_count': self.dropped,
+            'failed_count': self.failed,
+            'timestamp': datetime.now().isoformat()
+        }
+        summary.update(self.sketches.summary())
+        return summary
+
+
+def _insert(cursor, sql, values, fetch=False):
+    """Multi-row INSERT of all values in a single statement"""
+    return execute_values(cursor, sql, values, page_size=len(values), fetch=fetch)
+
+
+def write_batch(cursor, batch):
+    """Insert a batch of (kind, record) events and bump the matching counters"""
+    rows = {'view': [], 'search': [], 'upload': [], 'event': []}
+    for kind, record in batch:
+        rows[kind].append(record)
+
+    counters = Counter()
+
+    if rows['view']:
+        _insert(cursor, 'INSERT INTO analytics_page_views (page, user_id, created_at) VALUES %s',
+                [(r['page'], r['user_id'], r['timestamp']) for r in rows['view']])
+        for r in rows['view']:
+            counters[('page_views', r['page'])] += 1
+
+        # One row per user, keeping the earliest and latest sighting in the batch
+        users = {}
+        for r in rows['view']:
+            if r['user_id']:
+                first_seen = users[r['user_id']][3] if r['user_id'] in users else r['timestamp']
+                users[r['user_id']] = (r['user_id'], r['user_email'], r['user_name'], first_seen, r['timestamp'])
+        if users:
+            inserted = _insert(cursor, '''
+                INSERT INTO analytics_users (user_id, email, name, first_seen, last_seen) VALUES %s
+                ON CONFLICT (user_id) DO UPDATE SET last_seen = GREATEST(analytics_users.last_seen, EXCLUDED.last_seen)
+                RETURNING (xmax = 0)
+            ''', list(users.values()), fetch=True)
+            counters[('users', '')] += sum(1 for (is_new,) in inserted if is_new)
+
+    if rows['search']:
+        _insert(cursor, 'INSERT INTO analytics_searches (params, results_count, user_id, user_email, created_at) VALUES %s',
+                [(Json(r['params']), r['results_count'], r['user_id'], r['user_email'], r['timestamp']) for r in rows['search']])
+        counters[('searches', '')] += len(rows['search'])
+
+    if rows['upload']:
+        _insert(cursor, 'INSERT INTO analytics_uploads (file_info, user_id, user_email, created_at) VALUES %s',
+                [(Json(r['file_info']), r['user_id'], r['user_email'], r['timestamp']) for r in rows['upload']])
+        counters[('uploads', '')] += len(rows['upload'])
+
+    if rows['event']:
+        _insert(cursor, 'INSERT INTO analytics_events (event_type, event_data, user_id, user_email, created_at) VALUES %s',
+                [(r['event_type'], Json(r['event_data']), r['user_id'], r['user_email'], r['timestamp']) for r in rows['event']])
+        counters[('events', '')] += len(rows['event'])
+
+    if counters:
+        _insert(cursor, '''
+            INSERT INTO analytics_counters (metric, key, count) VALUES %s
+            ON CONFLICT (metric, key) DO UPDATE SET count = analytics_counters.count + EXCLUDED.count
+        ''', [(metric, key, count) for (metric, key), count in sorted(counters.items())])
+
+
+ANALYTICS = AnalyticsQueue(
+    maxsize=int(os.getenv('ANALYTICS_QUEUE_SIZE', '10000')),
+    batch_size=int(os.getenv('ANALYTICS_BATCH_SIZE', '500')),
+    flush_interval=float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '1'))
+)
+
+
+def _base_record(user=None):
+    """Timestamp and user fields, captured on the request thread
+
+    Background workers have no session and pass ``user`` explicitly as a dict
+    with ``user_id`` and ``user_email``.
+    """
+    if user is None:
+        user = {'user_id': session.get('google_id'), 'user_email': session.get('email')}
+    return {
+        'timestamp': datetime.now(timezone.utc),
+        'user_id': user.get('user_id'),
+        'user_email': user.get('user_email')
+    }
+
+
+def record_page_view(page):
+    """Record a page view"""
+    record = _base_record()
+    record['page'] = page
+    record['user_name'] = session.get('name')
+    return ANALYTICS.enqueue('view', record)
+
+
+def record_search(params, results_count):
+    """Record search parameters and result count"""
+    record = _base_record()
+    record['params'] = params
+    record['results_count'] = results_count
+    return ANALYTICS.enqueue('search', record)
+
+
+def record_upload(file_info, user=None):
+    """Record a file upload"""
+    record = _base_record(user)
+    record['file_info'] = file_info
+    return ANALYTICS.enqueue('upload', record)
+
+
+def record_event(event_type, event_data):
+    """Record a custom event"""
+    record = _base_record()
+    record['event_type'] = event_type
+    record['event_data'] = event_data
+    return ANALYTICS.enqueue('event', record)
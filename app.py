@@ -9,8 +9,8 @@ from pathlib import Path
 warnings.filterwarnings('ignore', message='.*OpenSSL.*LibreSSL.*')
 from flask import Flask, render_template, session, flash, redirect, request
 from dotenv import load_dotenv
-from psycopg2 import pool
-from db import init_db
+import db
+from db import ConnectionPool, init_db
 
 # Configure logging
 logging.basicConfig(
@@ -52,7 +52,18 @@ def create_app():
         secret_key = secret_key.decode('utf-8')
     
     app.secret_key = secret_key
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Limit uploads to 16MB
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_REQUEST_SIZE', str(100 * 1024 * 1024)))  # Several files per upload, 10MB each
+
+    # Hand each request's database connection back to the pool on teardown
+    db.init_app(app)
+
+    # Persist analytics through the app's connection pool
+    from analytics_core import ANALYTICS
+    ANALYTICS.init_app(app)
+
+    # Run file uploads as background jobs through the same pool
+    from upload_jobs import UPLOAD_JOBS
+    UPLOAD_JOBS.init_app(app)
 
     # Configure session handling
     if os.getenv('VERCEL_URL') or os.getenv('VERCEL_ENV'):
@@ -80,6 +91,18 @@ def create_app():
     # For Google authentication
     os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
     
+    # Compress HTML and JSON responses
+    from compression import COMPRESSION
+    COMPRESSION.init_app(app)
+
+    # Fingerprinted static URLs with long-lived caching
+    from static_assets import STATIC_ASSETS
+    STATIC_ASSETS.init_app(app)
+
+    # Cached <option> markup for the lookup dropdowns
+    from lookups import LOOKUP_CACHE
+    app.jinja_env.globals['lookup_options'] = LOOKUP_CACHE.options
+
     # Register app context data
     @app.context_processor
     def inject_context():
@@ -163,17 +186,19 @@ def create_app():
     @app.route('/static/<path:filename>')
     def static_files(filename):
         """Serve static files explicitly for Vercel compatibility"""
-        from flask import send_from_directory
-        import os
-        static_folder = app.static_folder or os.path.join(app.root_path, 'static')
-        return send_from_directory(static_folder, filename)
+        return STATIC_ASSETS.send(filename)
     
     return app
-# Create database connection pool
+# Create database connection pool; connections open on the first request that needs one
 CONNECTION_STRING = os.getenv('DATABASE_URL')
 try:
-    CONNECTION_POOL = pool.SimpleConnectionPool(1, 250, CONNECTION_STRING)
-    logger.info('Connection pool created successfully')
+    CONNECTION_POOL = ConnectionPool(
+        CONNECTION_STRING,
+        minconn=int(os.getenv('DB_POOL_MIN', '1')),
+        maxconn=int(os.getenv('DB_POOL_MAX', '20')),
+        timeout=float(os.getenv('DB_POOL_TIMEOUT', '5'))
+    )
+    logger.info('Connection pool configured')
 except Exception as e:
     logger.error(f"Error creating connection pool: {e}")
     CONNECTION_POOL = None
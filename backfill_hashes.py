@@ -0,0 +1,127 @@
+"""Fill in content_hash for files uploaded before deduplication
+
+Hashes are taken from Drive's sha256Checksum when it is available and
+otherwise computed by streaming the file down, several files at a time.
+Files that turn out to duplicate an already-hashed file are reported rather
+than hashed, so they can be reviewed and removed by hand.
+
+    python backfill_hashes.py --workers 8
+"""
+import argparse
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+from googleapiclient.http import MediaIoBaseDownload
+
+from db import ConnectionPool
+from drive import DRIVE, UPLOAD_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class HashingWriter:
+    """File-like sink that only keeps a running SHA-256 of what is written"""
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        return len(data)
+
+
+def drive_sha256(drive_file_id):
+    """SHA-256 hex digest of a Drive file, or None for Google-native documents"""
+    service = DRIVE.service()
+    info = DRIVE.execute(service.files().get(fileId=drive_file_id, fields='mimeType,sha256Checksum'), 'files.get')
+    if info.get('sha256Checksum'):
+        return info['sha256Checksum']
+    if info.get('mimeType', '').startswith('application/vnd.google-apps.'):
+        return None
+
+    # No checksum from Drive: stream the content through the hash
+    writer = HashingWriter()
+    downloader = MediaIoBaseDownload(writer, service.files().get_media(fileId=drive_file_id),
+                                     chunksize=UPLOAD_CHUNK_SIZE)
+    done = False
+    with DRIVE.timed('files.download'):
+        while not done:
+            _, done = downloader.next_chunk()
+    return writer.digest.hexdigest()
+
+
+def backfill(pool, workers=8, limit=None):
+    """Hash every file without a content_hash; returns a summary dict"""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, file_ID FROM files WHERE content_hash IS NULL ORDER BY id
+            LIMIT %s
+        ''', (limit,))
+        pending = cursor.fetchall()
+
+    summary = {'files': len(pending), 'hashed': 0, 'duplicates': [], 'skipped': 0, 'failed': 0}
+    logger.info(f"Hashing {len(pending)} files with {workers} workers")
+
+    # Results are stored from this thread only, so the duplicate check can't race
+    def store(file_id, content_hash):
+        # Claim the hash only if no other row has it, so the unique index never trips
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE files SET content_hash = %s
+                WHERE id = %s AND NOT EXISTS (SELECT 1 FROM files WHERE content_hash = %s)
+            ''', (content_hash, file_id, content_hash))
+            if cursor.rowcount:
+                return None
+            cursor.execute('SELECT id FROM files WHERE content_hash = %s', (content_hash,))
+            return cursor.fetchone()[0]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(drive_sha256, drive_file_id): file_id for file_id, drive_file_id in pending}
+        for future in as_completed(futures):
+            file_id = futures[future]
+            try:
+                content_hash = future.result()
+                original = store(file_id, content_hash) if content_hash else None
+            except Exception as e:
+                logger.warning(f"Could not hash file {file_id}: {e}")
+                summary['failed'] += 1
+                continue
+
+            if content_hash is None:
+                summary['skipped'] += 1
+            elif original is not None:
+                summary['duplicates'].append((file_id, original))
+            else:
+                summary['hashed'] += 1
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8, help='files hashed in parallel (default: 8)')
+    parser.add_argument('--limit', type=int, default=None, help='stop after this many files')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv("lock.env")
+    pool = ConnectionPool(os.getenv('DATABASE_URL'), 1, args.workers + 1)
+    try:
+        summary = backfill(pool, workers=args.workers, limit=args.limit)
+    finally:
+        pool.closeall()
+
+    print(f"{summary['hashed']} of {summary['files']} files hashed, {summary['skipped']} Google documents skipped, "
+          f"{summary['failed']} failed")
+    for file_id, original in summary['duplicates']:
+        print(f"File {file_id} duplicates file {original}")
+    print(f"Drive: {DRIVE.stats()['operations']}")
+
+
+if __name__ == '__main__':
+    main()
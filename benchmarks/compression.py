@@ -0,0 +1,67 @@
+"""Measure response bytes and CPU cost of compressing the main pages
+
+Requests each page through the test client with and without an
+Accept-Encoding that allows compression, and reports the bytes sent and the
+CPU time per request for each. The difference in CPU time is what the
+compression costs. Needs DATABASE_URL pointing at a seeded database.
+
+    python benchmarks/compression.py --requests 100 --level 6
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from compression import COMPRESSION, brotli  # noqa: E402
+
+# (label, method, path, form data)
+PAGES = [
+    ('search form', 'GET', '/search', None),
+    ('search results', 'POST', '/search', {'q': 'calculus', 'page_size': '100'}),
+    ('upload form', 'GET', '/upload', None),
+    ('lookups JSON', 'GET', '/api/api/lookups', None),
+]
+
+
+def per_request(client, method, path, data, encoding, requests):
+    """(body bytes, CPU ms per request) for one page and Accept-Encoding"""
+    headers = {'Accept-Encoding': encoding}
+    size = len(client.open(path, method=method, data=data, headers=headers).data)
+    start = time.process_time()
+    for _ in range(requests):
+        client.open(path, method=method, data=data, headers=headers)
+    return size, (time.process_time() - start) / requests * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100, help='requests per measurement (default: 100)')
+    parser.add_argument('--level', type=int, help='gzip level to measure (default: COMPRESS_LEVEL)')
+    parser.add_argument('--brotli-level', type=int, help='brotli quality to measure (default: COMPRESS_BROTLI_LEVEL)')
+    args = parser.parse_args()
+
+    if args.level is not None:
+        COMPRESSION.levels['gzip'] = args.level
+    if args.brotli_level is not None:
+        COMPRESSION.levels['br'] = args.brotli_level
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update({'google_id': 'benchmark', 'email': 'benchmark@aus.edu', 'name': 'Benchmark'})
+
+    print(f"levels: {COMPRESSION.levels}, {args.requests} requests per row")
+    print(f"{'page':<16} {'encoding':<9} {'bytes':>9} {'ratio':>6} {'cpu ms/req':>11}")
+    for label, method, path, data in PAGES:
+        baseline = None
+        for encoding in encodings:
+            size, cpu_ms = per_request(client, method, path, data, encoding, args.requests)
+            baseline = baseline or size
+            print(f"{label:<16} {encoding:<9} {size:>9} {size / baseline:>6.2f} {cpu_ms:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
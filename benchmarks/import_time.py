@@ -0,0 +1,80 @@
+"""Measure how long a cold start spends importing the app
+
+Runs ``python -X importtime -c "import app"`` a few times in fresh
+interpreters, keeps the fastest run, and reports the modules that cost the
+most. Exits nonzero when importing the app takes longer than the budget or
+pulls in a dependency that should only load on first use, so it can gate a
+deploy the same way a failing test would.
+
+    python benchmarks/import_time.py --budget-ms 400
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only the routes that talk to Drive or Google sign-in should load these
+LAZY_MODULES = ('googleapiclient', 'google_auth_oauthlib', 'google.auth', 'cachecontrol', 'requests', 'oauthlib',
+                'httplib2')
+
+
+def measure(module='app'):
+    """Import times for one fresh interpreter as {module: (self_us, cumulative_us)}"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    # Keep the pool from pointing anywhere real; it doesn't connect at import anyway
+    env.setdefault('DATABASE_URL', '')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        if name == 'site':
+            # Everything so far was interpreter startup, which the app can't change
+            times.clear()
+            continue
+        times[name] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('IMPORT_BUDGET_MS', '400')),
+                        help='fail when importing the app takes longer than this (default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to try, fastest wins (default: 5)')
+    parser.add_argument('--top', type=int, default=15, help='slowest modules to list (default: 15)')
+    parser.add_argument('--module', default='app', help='module to import (default: %(default)s)')
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    best = min(runs, key=lambda times: times[args.module][1])
+    total_ms = best[args.module][1] / 1000
+
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    slowest = sorted(best.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import {args.module} took {total_ms:.1f}ms, over the {args.budget_ms:.0f}ms budget")
+    eager = sorted(name for name in best if name.split('.')[0] in LAZY_MODULES or name in LAZY_MODULES)
+    eager = [name for name in eager if not any(name.startswith(other + '.') for other in eager)]
+    if eager:
+        failures.append(f"imported at startup but should load lazily: {', '.join(eager)}")
+
+    print(f"\nimport {args.module}: {total_ms:.1f}ms (best of {args.runs}), budget {args.budget_ms:.0f}ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, abort
 import logging
 import os
+from db import get_db
+from lookups import LOOKUP_CACHE
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -37,8 +39,6 @@ def admin_login():
 @admin_required
 def admin_panel():
     """Admin panel for managing courses, professors, semesters, and suggestions"""
-    from app import CONNECTION_POOL
-
     # Handle form submissions
     course = request.form.get('course')
     prof = request.form.get('prof')
@@ -46,26 +46,38 @@ def admin_panel():
     suggestion = request.form.get('suggestion')
     
     try:
-        with CONNECTION_POOL.getconn() as conn:
+        with get_db() as conn:
             cursor = conn.cursor()
             
             # Add new course
             if course:
-                cursor.execute('INSERT INTO courses (name) VALUES (%s)', (course,))
-                session['flash_message'] = f"Course '{course}' added successfully"
-                session['flash_category'] = "success"
+                cursor.execute('INSERT INTO courses (name) VALUES (%s) ON CONFLICT DO NOTHING', (course,))
+                if cursor.rowcount:
+                    session['flash_message'] = f"Course '{course}' added successfully"
+                    session['flash_category'] = "success"
+                else:
+                    session['flash_message'] = f"Course '{course}' already exists"
+                    session['flash_category'] = "info"
                 
             # Add new professor
             if prof:
-                cursor.execute('INSERT INTO professors (name) VALUES (%s)', (prof,))
-                session['flash_message'] = f"Professor '{prof}' added successfully"
-                session['flash_category'] = "success"
+                cursor.execute('INSERT INTO professors (name) VALUES (%s) ON CONFLICT DO NOTHING', (prof,))
+                if cursor.rowcount:
+                    session['flash_message'] = f"Professor '{prof}' added successfully"
+                    session['flash_category'] = "success"
+                else:
+                    session['flash_message'] = f"Professor '{prof}' already exists"
+                    session['flash_category'] = "info"
                 
             # Add new semester
             if semester:
-                cursor.execute('INSERT INTO semesters (name) VALUES (%s)', (semester,))
-                session['flash_message'] = f"Semester '{semester}' added successfully"
-                session['flash_category'] = "success"
+                cursor.execute('INSERT INTO semesters (name) VALUES (%s) ON CONFLICT DO NOTHING', (semester,))
+                if cursor.rowcount:
+                    session['flash_message'] = f"Semester '{semester}' added successfully"
+                    session['flash_category'] = "success"
+                else:
+                    session['flash_message'] = f"Semester '{semester}' already exists"
+                    session['flash_category'] = "info"
                 
             # Add new suggestion
             if suggestion:
@@ -74,49 +86,56 @@ def admin_panel():
                 session['flash_category'] = "success"
                 
             conn.commit()
+            
+        # Refresh cached dropdown data after catalog changes
+        changed = [table for table, value in (('courses', course), ('professors', prof), ('semesters', semester)) if value]
+        if changed:
+            LOOKUP_CACHE.invalidate(*changed)
     except Exception as e:
         logging.error(f"Admin panel error: {str(e)}")
         session['flash_message'] = f"An error occurred: {str(e)}"
         session['flash_category'] = "danger"
     
     # Get data for admin panel
-    with CONNECTION_POOL.getconn() as conn:
+    with get_db() as conn:
         cursor = conn.cursor()
         
         # Get all reported files
-        cursor.execute('SELECT * FROM files WHERE reported=TRUE')
+        cursor.execute('''
+            SELECT f.id, f.filename, f.course,
+                   COALESCE(string_agg(p.name, ', ' ORDER BY p.name), f.profs) AS profs,
+                   f.year, f.semester, f.file_type, f.file_ID, f.file_link, f.uploaded_by, f.reported
+            FROM files f
+            LEFT JOIN file_professors fp ON fp.file_id = f.id
+            LEFT JOIN professors p ON p.id = fp.professor_id
+            WHERE f.reported = TRUE
+            GROUP BY f.id
+            ORDER BY f.id DESC
+        ''')
         reported_files = cursor.fetchall()
         
-        # Get unique values for dropdowns
-        def get_unique_values(table):
-            cursor.execute(f'SELECT name FROM {table}')
-            return [row[0] for row in cursor.fetchall()]
-        
-        courses = get_unique_values('courses')
-        professors = get_unique_values('professors')
-        semesters = get_unique_values('semesters')
-        
         # Get all suggestions
         cursor.execute('SELECT suggestion, id FROM suggestions ORDER BY id DESC')
         suggestions = cursor.fetchall()
 
+    # Get unique values for dropdowns
+    lookups = LOOKUP_CACHE.get_all()
+
     return render_template('admin.html', 
-                          courses=courses, 
-                          professors=professors, 
-                          semesters=semesters, 
+                          courses=lookups['courses'], 
+                          professors=lookups['professors'], 
+                          semesters=lookups['semesters'], 
                           suggestions=suggestions,
                           reported_files=reported_files)
 
 @admin_bp.route('/admin/delete_suggestion/<int:suggestion_id>', methods=['POST'])
 def delete_suggestion(suggestion_id):
     """Delete a suggestion"""
-    from app import CONNECTION_POOL
-    
     if not session.get('admin_logged_in'):
         abort(403)
         
     try:
-        with CONNECTION_POOL.getconn() as conn:
+        with get_db() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM suggestions WHERE id = %s', (suggestion_id,))
             conn.commit()
@@ -132,13 +151,11 @@ def delete_suggestion(suggestion_id):
 @admin_bp.route('/admin/resolve_report/<int:file_id>', methods=['POST'])
 def resolve_report(file_id):
     """Mark a reported file as resolved"""
-    from app import CONNECTION_POOL
-    
     if not session.get('admin_logged_in'):
         abort(403)
         
     try:
-        with CONNECTION_POOL.getconn() as conn:
+        with get_db() as conn:
             cursor = conn.cursor()
             cursor.execute('UPDATE files SET reported = FALSE WHERE id = %s', (file_id,))
             conn.commit()
@@ -154,13 +171,11 @@ def resolve_report(file_id):
 @admin_bp.route('/admin/delete_file/<int:file_id>', methods=['POST'])
 def delete_file(file_id):
     """Delete a file from the database"""
-    from app import CONNECTION_POOL
-    
     if not session.get('admin_logged_in'):
         abort(403)
         
     try:
-        with CONNECTION_POOL.getconn() as conn:
+        with get_db() as conn:
             cursor = conn.cursor()
             # Get file ID from Google Drive before deleting
             cursor.execute('SELECT file_ID FROM files WHERE id = %s', (file_id,))
@@ -1,18 +1,21 @@
 from flask import Blueprint, jsonify, request, session
 import logging
-import time
-from datetime import datetime
+from analytics_core import ANALYTICS, record_event as queue_event, record_page_view
 
 # Analytics blueprint
+# Searches and uploads are recorded in process through analytics_core;
+# these endpoints only take browser-originated events.
 analytics_bp = Blueprint('analytics', __name__)
 
-# In-memory storage for basic analytics
-# In a production environment, this would be stored in a database
-PAGE_VIEWS = {}
-SEARCH_ANALYTICS = []
-UPLOAD_ANALYTICS = []
-USER_ANALYTICS = {}
-EVENT_ANALYTICS = []
+# Upper bound on events accepted from a single batch request
+MAX_BATCH_EVENTS = 100
+
+# Longest page path or event type accepted from the browser
+MAX_NAME_LENGTH = 200
+
+def valid_name(value):
+    """Whether a page or event type from the browser is a short, non-empty string"""
+    return isinstance(value, str) and 0 < len(value.strip()) <= MAX_NAME_LENGTH
 
 @analytics_bp.route('/api/analytics/record-view', methods=['POST'])
 def record_view():
@@ -21,85 +24,43 @@ def record_view():
         return jsonify({'error': 'Invalid request'}), 400
         
     data = request.json
-    if not data:
+    if not isinstance(data, dict) or not data:
         return jsonify({'error': 'Invalid JSON data'}), 400
         
     page = data.get('page')
     
-    if not page:
+    if not valid_name(page):
         return jsonify({'error': 'Page not specified'}), 400
         
     # Record the page view
-    if page in PAGE_VIEWS:
-        PAGE_VIEWS[page] += 1
-    else:
-        PAGE_VIEWS[page] = 1
-        
-    # Record user info if available
-    user_id = session.get('google_id')
-    if user_id:
-        if user_id not in USER_ANALYTICS:
-            USER_ANALYTICS[user_id] = {
-                'email': session.get('email', 'unknown'),
-                'name': session.get('name', 'unknown'),
-                'first_seen': datetime.now().isoformat(),
-                'page_views': {}
-            }
-            
-        user_data = USER_ANALYTICS[user_id]
-        if page in user_data['page_views']:
-            user_data['page_views'][page] += 1
-        else:
-            user_data['page_views'][page] = 1
-        user_data['last_seen'] = datetime.now().isoformat()
-    
-    return jsonify({'success': True})
-
-@analytics_bp.route('/api/analytics/record-search', methods=['POST'])
-def record_search():
-    """Record search parameters for analytics"""
-    if not request.is_json:
-        return jsonify({'error': 'Invalid request'}), 400
-        
-    data = request.json
-    if not data:
-        return jsonify({'error': 'Invalid JSON data'}), 400
-        
-    search_params = data.get('params', {})
-    results_count = data.get('results_count', 0)
+    record_page_view(page)
     
-    search_record = {
-        'timestamp': datetime.now().isoformat(),
-        'params': search_params,
-        'results_count': results_count,
-        'user_id': session.get('google_id'),
-        'user_email': session.get('email')
-    }
-    
-    SEARCH_ANALYTICS.append(search_record)
     return jsonify({'success': True})
 
-@analytics_bp.route('/api/analytics/record-upload', methods=['POST'])
-def record_upload():
-    """Record file upload for analytics"""
+@analytics_bp.route('/api/analytics/record-batch', methods=['POST'])
+def record_batch():
+    """Record a batch of page views and custom events sent by the browser"""
     if not request.is_json:
         return jsonify({'error': 'Invalid request'}), 400
         
-    data = request.json
-    if not data:
+    data = request.get_json(silent=True)
+    events = data.get('events') if isinstance(data, dict) else None
+    if not isinstance(events, list):
         return jsonify({'error': 'Invalid JSON data'}), 400
         
-    file_info = data.get('file_info', {})
-    
-    upload_record = {
-        'timestamp': datetime.now().isoformat(),
-        'file_info': file_info,
-        'user_id': session.get('google_id'),
-        'user_email': session.get('email')
-    }
-    
-    UPLOAD_ANALYTICS.append(upload_record)
-    return jsonify({'success': True})
+    recorded = 0
+    for event in events[:MAX_BATCH_EVENTS]:
+        if not isinstance(event, dict):
+            continue
+        if event.get('type') == 'view' and valid_name(event.get('page')):
+            record_page_view(event['page'])
+            recorded += 1
+        elif (event.get('type') == 'event' and valid_name(event.get('event_type'))
+              and isinstance(event.get('event_data', {}), dict)):
+            queue_event(event['event_type'], event.get('event_data', {}))
+            recorded += 1
+            
+    return jsonify({'success': True, 'recorded': recorded})
 
 @analytics_bp.route('/api/analytics/summary', methods=['GET'])
 def analytics_summary():
@@ -107,14 +68,7 @@ def analytics_summary():
     if not session.get('admin_logged_in'):
         return jsonify({'error': 'Unauthorized'}), 403
         
-    summary = {
-        'page_views': PAGE_VIEWS,
-        'user_count': len(USER_ANALYTICS),
-        'search_count': len(SEARCH_ANALYTICS),
-        'upload_count': len(UPLOAD_ANALYTICS),
-        'event_count': len(EVENT_ANALYTICS),
-        'timestamp': datetime.now().isoformat()
-    }
+    summary = ANALYTICS.summary()
     
     return jsonify(summary)
 
@@ -125,23 +79,17 @@ def record_event():
         return jsonify({'error': 'Invalid request'}), 400
         
     data = request.json
-    if not data:
+    if not isinstance(data, dict) or not data:
         return jsonify({'error': 'Invalid JSON data'}), 400
         
     event_type = data.get('event_type')
     event_data = data.get('event_data', {})
     
-    if not event_type:
+    if not valid_name(event_type):
         return jsonify({'error': 'Event type not specified'}), 400
+    if not isinstance(event_data, dict):
+        return jsonify({'error': 'Event data must be an object'}), 400
         
     # Record the event
-    event_record = {
-        'timestamp': datetime.now().isoformat(),
-        'event_type': event_type,
-        'event_data': event_data,
-        'user_id': session.get('google_id'),
-        'user_email': session.get('email')
-    }
-    
-    EVENT_ANALYTICS.append(event_record)
+    queue_event(event_type, event_data)
     return jsonify({'success': True})
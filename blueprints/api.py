@@ -1,10 +1,23 @@
-from flask import Blueprint, request, jsonify, abort
+from flask import Blueprint, request, jsonify, abort, current_app, session
+import json
 import logging
 import os
+from lookups import LOOKUP_CACHE, LOOKUP_TABLES, fingerprint
+from search import SEARCH_COLUMNS, parse_page_size, rank_files, search_files
 
 # API blueprint for miscellaneous API endpoints
 api_bp = Blueprint('api', __name__)
 
+# How long browsers and CDNs may reuse a lookup listing before revalidating it
+LOOKUP_MAX_AGE = int(os.getenv('LOOKUP_MAX_AGE', '300'))
+
+# Typeahead suggestions returned by default and at most
+SUGGEST_LIMIT = int(os.getenv('SUGGEST_LIMIT', '20'))
+MAX_SUGGEST_LIMIT = 100
+
+# Serialized lookup listings: tables -> (etag, JSON body)
+LOOKUP_PAYLOADS = {}
+
 @api_bp.route('/api/health', methods=['GET'])
 def health_check():
     """API health check endpoint"""
@@ -13,90 +26,168 @@ def health_check():
         'message': 'AUS Archive API is running'
     })
 
-@api_bp.route('/api/courses', methods=['GET'])
-def get_courses():
-    """Get all courses"""
-    from app import CONNECTION_POOL
-    
-    try:
-        with CONNECTION_POOL.getconn() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT name FROM courses ORDER BY name')
-            courses = [row[0] for row in cursor.fetchall()]
-            
+@api_bp.route('/api/pool-stats', methods=['GET'])
+def pool_stats():
+    """Database connection pool usage, for sizing the pool under load - admin only"""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    connection_pool = current_app.config.get('CONNECTION_POOL')
+    if connection_pool is None:
         return jsonify({
-            'status': 'success',
-            'courses': courses
-        })
+            'status': 'error',
+            'message': 'Connection pool not available'
+        }), 503
+        
+    return jsonify({
+        'status': 'success',
+        'pool': connection_pool.stats()
+    })
+
+@api_bp.route('/api/drive-stats', methods=['GET'])
+def drive_stats():
+    """Google Drive API call counts and latencies - admin only"""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    from drive import DRIVE
+
+    return jsonify({
+        'status': 'success',
+        'drive': DRIVE.stats()
+    })
+
+def lookup_response(*tables):
+    """JSON listing of lookup tables with a strong ETag from their versions
+
+    The ETag is checked against the in-memory lookup cache, so a client
+    revalidating an unchanged list gets a 304 without a database query, and
+    the serialized body is reused until a table's version changes.
+    """
+    try:
+        versions = [LOOKUP_CACHE.version(table) for table in tables]
     except Exception as e:
-        logging.error(f"Error fetching courses: {str(e)}")
+        logging.error(f"Error fetching {', '.join(tables)}: {str(e)}")
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
+    etag = versions[0] if len(versions) == 1 else fingerprint(versions)
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        cached = LOOKUP_PAYLOADS.get(tables)
+        if cached is None or cached[0] != etag:
+            lookups = LOOKUP_CACHE.get_all()
+            payload = {'status': 'success'}
+            for table in tables:
+                payload[table] = sorted(lookups[table])
+            cached = LOOKUP_PAYLOADS[tables] = (etag, json.dumps(payload))
+        response = current_app.response_class(cached[1], mimetype='application/json')
+
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = LOOKUP_MAX_AGE
+    return response
+
+@api_bp.route('/api/courses', methods=['GET'])
+def get_courses():
+    """Get all courses"""
+    return lookup_response('courses')
+
 @api_bp.route('/api/professors', methods=['GET'])
 def get_professors():
     """Get all professors"""
-    from app import CONNECTION_POOL
-    
-    try:
-        with CONNECTION_POOL.getconn() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT name FROM professors ORDER BY name')
-            professors = [row[0] for row in cursor.fetchall()]
-            
-        return jsonify({
-            'status': 'success',
-            'professors': professors
-        })
-    except Exception as e:
-        logging.error(f"Error fetching professors: {str(e)}")
-        return jsonify({
-            'status': 'error',
-            'message': str(e)
-        }), 500
+    return lookup_response('professors')
 
 @api_bp.route('/api/file-types', methods=['GET'])
 def get_file_types():
     """Get all file types"""
-    from app import CONNECTION_POOL
-    
+    return lookup_response('file_types')
+
+@api_bp.route('/api/semesters', methods=['GET'])
+def get_semesters():
+    """Get all semesters"""
+    return lookup_response('semesters')
+
+@api_bp.route('/api/lookups', methods=['GET'])
+def get_lookups():
+    """Get courses, professors, file types and semesters in one response"""
+    return lookup_response(*LOOKUP_TABLES)
+
+def suggest_response(table):
+    """Typeahead matches for ``q`` from a lookup table's in-memory prefix index"""
     try:
-        with CONNECTION_POOL.getconn() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT name FROM file_types ORDER BY name')
-            file_types = [row[0] for row in cursor.fetchall()]
-            
-        return jsonify({
-            'status': 'success',
-            'file_types': file_types
-        })
+        limit = max(1, min(int(request.args.get('limit', SUGGEST_LIMIT)), MAX_SUGGEST_LIMIT))
+    except ValueError:
+        limit = SUGGEST_LIMIT
+
+    try:
+        results = LOOKUP_CACHE.suggest(table, request.args.get('q', ''), limit)
     except Exception as e:
-        logging.error(f"Error fetching file types: {str(e)}")
+        logging.error(f"Error suggesting {table}: {str(e)}")
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
-@api_bp.route('/api/semesters', methods=['GET'])
-def get_semesters():
-    """Get all semesters"""
-    from app import CONNECTION_POOL
+    response = jsonify({
+        'status': 'success',
+        'results': results
+    })
+    response.cache_control.public = True
+    response.cache_control.max_age = LOOKUP_MAX_AGE
+    return response
+
+@api_bp.route('/api/courses/suggest', methods=['GET'])
+def suggest_courses():
+    """Courses matching a typeahead query"""
+    return suggest_response('courses')
+
+@api_bp.route('/api/professors/suggest', methods=['GET'])
+def suggest_professors():
+    """Professors matching a typeahead query"""
+    return suggest_response('professors')
+
+@api_bp.route('/api/search', methods=['GET'])
+def search_api():
+    """Search files with keyset pagination
+
+    Filters: course, prof (repeatable), file_type, year, semester.
+    Pass the returned next_cursor as ``cursor`` to fetch the following page.
+    With ``q``, results are ranked by relevance instead and limited to one page.
+    """
+    filters = {
+        'course': request.args.get('course', ''),
+        'profs': request.args.getlist('prof'),
+        'file_type': request.args.get('file_type', ''),
+        'year': request.args.get('year', ''),
+        'semester': request.args.get('semester', '')
+    }
+    q = request.args.get('q', '').strip()
+    page_size = parse_page_size(request.args.get('page_size'))
     
     try:
-        with CONNECTION_POOL.getconn() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT name FROM semesters ORDER BY name')
-            semesters = [row[0] for row in cursor.fetchall()]
-            
+        if q:
+            files, next_cursor = rank_files(q, limit=page_size, **filters), None
+        else:
+            files, next_cursor = search_files(cursor=request.args.get('cursor') or None,
+                                              page_size=page_size, **filters)
+    except ValueError as e:
         return jsonify({
-            'status': 'success',
-            'semesters': semesters
-        })
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
-        logging.error(f"Error fetching semesters: {str(e)}")
+        logging.error(f"Error searching files: {str(e)}")
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
+        
+    return jsonify({
+        'status': 'success',
+        'files': [dict(zip((column.lower() for column in SEARCH_COLUMNS), row)) for row in files],
+        'next_cursor': next_cursor
+    })
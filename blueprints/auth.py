@@ -4,12 +4,6 @@ import os
 import pathlib
 import urllib.request
 import json
-from google_auth_oauthlib.flow import Flow
-from google.oauth2 import id_token
-from google.auth.transport import requests
-import cachecontrol
-import requests as req
-import google.auth.transport.requests
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -18,6 +12,9 @@ GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 
 # Create OAuth flow
 def get_oauth_flow():
+    # The OAuth client stack is slow to import, so only the login routes load it
+    from google_auth_oauthlib.flow import Flow
+
     # Determine the correct redirect URI based on environment
     if os.getenv('VERCEL_URL') or os.getenv('VERCEL_ENV'):
         # Running on Vercel
@@ -101,10 +98,6 @@ def callback():
         credentials = flow.credentials
         logging.info("Token fetched successfully")
         
-        request_session = req.session()
-        cached_session = cachecontrol.CacheControl(request_session)
-        token_request = google.auth.transport.requests.Request(session=cached_session)
-
         logging.info("Getting user info from Google...")
         # Use the access token to get user info from Google's userinfo endpoint
         # This is more reliable than trying to verify the ID token
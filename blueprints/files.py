@@ -1,14 +1,40 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, abort, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, session, abort, current_app, jsonify
 import logging
-from io import BytesIO
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
 import os
 from functools import wraps
+from analytics_core import record_search, record_upload
+from db import find_file_by_hash, get_db, insert_file
+from drive import DRIVE
+from lookups import LOOKUP_CACHE
+from search import DEFAULT_PAGE_SIZE, parse_page_size, rank_files, search_files
+from upload_jobs import UPLOAD_JOBS, discard_staged, stage_upload
 
 files_bp = Blueprint('files', __name__)
 
+# Maximum accepted upload size
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
+# Maximum number of files in one upload form submission
+MAX_FILES_PER_UPLOAD = int(os.getenv('MAX_FILES_PER_UPLOAD', '20'))
+
+# How much of the file is read to check its type
+SNIFF_SIZE = 8192
+
+# Allowed extensions -> (magic byte prefixes, MIME type); None means plain text
+OLE_SIGNATURE = (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',)
+ZIP_SIGNATURES = (b'PK\x03\x04', b'PK\x05\x06')
+FILE_SIGNATURES = {
+    'pdf': ((b'%PDF',), 'application/pdf'),
+    'doc': (OLE_SIGNATURE, 'application/msword'),
+    'docx': (ZIP_SIGNATURES, 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    'ppt': (OLE_SIGNATURE, 'application/vnd.ms-powerpoint'),
+    'pptx': (ZIP_SIGNATURES, 'application/vnd.openxmlformats-officedocument.presentationml.presentation'),
+    'xls': (OLE_SIGNATURE, 'application/vnd.ms-excel'),
+    'xlsx': (ZIP_SIGNATURES, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'txt': (None, 'text/plain'),
+    'zip': (ZIP_SIGNATURES, 'application/zip'),
+}
+
 # Decorator to check if user is logged in
 def login_required(f):
     @wraps(f)
@@ -23,100 +49,33 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def authenticate():
-    """Authenticate with Google Drive API"""
-    try:
-        # Try to use helper function first (supports both local and Vercel)
-        from app import get_service_account_credentials
-        credentials_data = get_service_account_credentials()
-        if credentials_data:
-            SCOPES = os.getenv("DRIVE_SCOPES", "").split(",")
-            return service_account.Credentials.from_service_account_info(credentials_data, scopes=SCOPES)
-    except Exception as e:
-        logging.error(f"Failed to get credentials from helper function: {e}")
-    
-    # Fallback to local file approach
-    SCOPES = os.getenv("DRIVE_SCOPES", "").split(",")
-    SERVICE_ACCOUNT_FILE = os.getenv("SERVICE_ACCOUNT_FILE")
-    
-    if SERVICE_ACCOUNT_FILE and os.path.exists(SERVICE_ACCOUNT_FILE):
-        creds = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-        return creds
-    
-    raise Exception("No service account credentials found")
-
-def google_upload(file, file_name):
-    """Upload file to Google Drive"""
-    PARENT_FOLDER_ID = os.getenv("PARENT_FOLDER_ID")
-    
-    logging.debug("Authenticating for Google Drive API")
-    creds = authenticate()
-    service = build('drive', 'v3', credentials=creds)
-
-    file_metadata = {
-        'name': file_name,
-        'parents': [PARENT_FOLDER_ID]
-    }
-    
-    media = MediaIoBaseUpload(BytesIO(file.read()), mimetype='application/octet-stream', resumable=True)
-    file.seek(0)
-    
-    try:
-        logging.debug("Uploading file to Google Drive")
-        file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-        logging.debug('File ID: %s', file.get('id'))
-        return file.get('id')
-    except Exception as e:
-        logging.error("An error occurred during file upload: %s", e)
-        raise
-
-def google_retrieve_links(file_ID):
-    """Retrieve shareable link for uploaded file"""
-    logging.debug("Retrieving links for uploaded file")
-    creds = authenticate()
-    service = build('drive', 'v3', credentials=creds)
-    
-    # Make the file publicly accessible
-    permission = {
-        'type': 'anyone',
-        'role': 'reader',
-    }
-    service.permissions().create(fileId=file_ID, body=permission).execute()
-    
-    # Get the shareable link
-    file = service.files().get(fileId=file_ID, fields='webViewLink').execute()
-    return file['webViewLink']
-
 def process_drive_link(drive_url, course, file_type, profs, semester, year):
-    """Process Google Drive link and extract file information"""
+    """Process Google Drive link and extract file information
+
+    Returns (file_id, filename, link, sha256) where the checksum is only known
+    for binary files the service account can read.
+    """
     import re
     
     try:
         # Extract file ID from various Google Drive URL formats
         file_id = extract_drive_file_id(drive_url)
         if not file_id:
-            return None, None, None
+            return None, None, None, None
         
         # Try to get file information from Google Drive API
         try:
-            from app import get_service_account_credentials
-            credentials_data = get_service_account_credentials()
-            if credentials_data:
-                creds = service_account.Credentials.from_service_account_info(
-                    credentials_data, 
-                    scopes=os.getenv("DRIVE_SCOPES", "").split(",")
-                )
-                service = build('drive', 'v3', credentials=creds)
-                
-                # Get file information
-                file_info = service.files().get(fileId=file_id, fields='name,mimeType,webViewLink').execute()
-                
-                # Create a descriptive filename
-                original_name = file_info.get('name', 'Unknown')
-                file_extension = os.path.splitext(original_name)[1] or get_extension_from_mimetype(file_info.get('mimeType', ''))
-                filename = f"{course[:7]}-{file_type}-{profs}-{semester}-{year}-{original_name}"
-                
-                return file_id, filename, file_info['webViewLink']
+            service = DRIVE.service()
+            
+            # Get file information
+            file_info = DRIVE.execute(service.files().get(fileId=file_id, fields='name,mimeType,webViewLink,sha256Checksum'), 'files.get')
+            
+            # Create a descriptive filename
+            original_name = file_info.get('name', 'Unknown')
+            file_extension = os.path.splitext(original_name)[1] or get_extension_from_mimetype(file_info.get('mimeType', ''))
+            filename = f"{course[:7]}-{file_type}-{profs}-{semester}-{year}-{original_name}"
+            
+            return file_id, filename, file_info['webViewLink'], file_info.get('sha256Checksum')
         except Exception as e:
             logging.warning(f"Could not access file info via API: {e}")
         
@@ -124,11 +83,11 @@ def process_drive_link(drive_url, course, file_type, profs, semester, year):
         filename = f"{course[:7]}-{file_type}-{profs}-{semester}-{year}-SharedLink"
         
         # Return the provided URL as the link (user must ensure it's shareable)
-        return file_id, filename, drive_url
+        return file_id, filename, drive_url, None
         
     except Exception as e:
         logging.error(f"Error processing drive link: {e}")
-        return None, None, None
+        return None, None, None, None
 
 def extract_drive_file_id(url):
     """Extract file ID from Google Drive URL"""
@@ -140,6 +99,7 @@ def extract_drive_file_id(url):
         r'/document/d/([a-zA-Z0-9-_]+)',  # Google Docs
         r'/spreadsheets/d/([a-zA-Z0-9-_]+)',  # Google Sheets
         r'/presentation/d/([a-zA-Z0-9-_]+)',  # Google Slides
+        r'/folders/([a-zA-Z0-9-_]+)',  # https://drive.google.com/drive/folders/FOLDER_ID
         r'id=([a-zA-Z0-9-_]+)',  # Query parameter format
     ]
     
@@ -166,49 +126,182 @@ def get_extension_from_mimetype(mimetype):
     }
     return mime_to_ext.get(mimetype, '')
 
-def get_unique_values(table):
-    """Get unique values from a database table"""
-    from app import CONNECTION_POOL
-    
-    with CONNECTION_POOL.getconn() as conn:
-        cursor = conn.cursor()
-        query = f'SELECT name FROM {table}'
-        cursor.execute(query)
-        values = [row[0] for row in cursor.fetchall()]
-    return values
-
 def validate_file(file):
-    """Validate file type and size"""
+    """Validate file type and size without reading the whole file into memory"""
     # Check if file is provided
     if not file or file.filename == '':
         return False, "No file selected"
         
     # Check allowed extensions
-    allowed_extensions = {'pdf', 'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx', 'txt', 'zip'}
     file_ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
     
-    if file_ext not in allowed_extensions:
-        return False, f"File type not allowed. Allowed types: {', '.join(allowed_extensions)}"
+    if file_ext not in FILE_SIGNATURES:
+        return False, f"File type not allowed. Allowed types: {', '.join(FILE_SIGNATURES)}"
     
-    # Check file size (limit to 10MB)
-    if len(file.read()) > 10 * 1024 * 1024:  # 10MB in bytes
-        file.seek(0)
+    # Check file size (limit to 10MB) from the stream position
+    stream = file.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if size > MAX_UPLOAD_SIZE:
         return False, "File size exceeds 10MB limit"
     
-    file.seek(0)
+    # Check the content matches the extension using the first chunk
+    head = stream.read(SNIFF_SIZE)
+    stream.seek(0)
+    signatures, _ = FILE_SIGNATURES[file_ext]
+    if signatures is None:
+        valid_content = b'\x00' not in head
+    else:
+        valid_content = head.startswith(signatures)
+    if not valid_content:
+        return False, f"File content does not match the .{file_ext} extension"
+    
     return True, "File is valid"
 
+def wants_json():
+    """Whether the client asked for a JSON response instead of a redirect"""
+    return (request.accept_mimetypes.best == 'application/json'
+            or request.headers.get('X-Requested-With') == 'XMLHttpRequest')
+
+def duplicate_response(existing):
+    """Tell the user the file is already in the archive, with its link"""
+    file_id, file_link = existing
+    logging.info(f"Duplicate upload of file {file_id} skipped")
+    if wants_json():
+        return jsonify({'status': 'duplicate', 'file_id': file_id, 'file_link': file_link})
+    session['flash_message'] = f"This file is already in the archive: {file_link}"
+    session['flash_category'] = "info"
+    return redirect(url_for('main.index'))
+
+def get_upload_mimetype(filename):
+    """MIME type for an allowed upload, based on its (validated) extension"""
+    file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    return FILE_SIGNATURES.get(file_ext, (None, 'application/octet-stream'))[1]
+
+def queue_file_uploads(files, fields):
+    """Validate, stage and deduplicate uploaded files, queueing the rest as one batch
+
+    ``fields`` are the files row values shared by every file. Returns one
+    result dict per file, in order.
+    """
+    course, profs = fields['course'], ', '.join(fields['prof_names'])
+    results = []
+    uploads = []
+    seen_hashes = set()
+    for file in files:
+        result = {'filename': file.filename}
+        results.append(result)
+        
+        # Validate file
+        is_valid, message = validate_file(file)
+        if not is_valid:
+            result.update(status='invalid', error=message)
+            continue
+        
+        # Create filename, telling apart files shared in one submission by their own name
+        stem, file_extension = os.path.splitext(file.filename)
+        suffix = f"-{stem}" if len(files) > 1 else ''
+        filename = f"{course[:7]}-{fields['file_type']}-{profs}-{fields['semester']}-{fields['year']}{suffix}{file_extension}"
+        
+        staged_path = None
+        try:
+            # Hash while staging so a known file never goes to Drive again
+            staged_path, content_hash = stage_upload(file)
+            with get_db() as conn:
+                existing = find_file_by_hash(conn.cursor(), content_hash)
+        except Exception as e:
+            logging.error(f"Could not stage upload {file.filename}: {str(e)}")
+            if staged_path:
+                discard_staged(staged_path)
+            result.update(status='failed', error="Upload failed. Please try again.")
+            continue
+        
+        if existing or content_hash in seen_hashes:
+            discard_staged(staged_path)
+            result.update(status='duplicate', file_link=existing[1] if existing else None)
+            continue
+        seen_hashes.add(content_hash)
+        
+        metadata = dict(fields, filename=filename, mimetype=get_upload_mimetype(file.filename), content_hash=content_hash)
+        uploads.append((result, staged_path, metadata))
+    
+    if uploads:
+        try:
+            job_ids = UPLOAD_JOBS.submit_batch([
+                (staged_path, result['filename'], metadata) for result, staged_path, metadata in uploads
+            ])
+        except Exception as e:
+            logging.error(f"Could not queue uploads: {str(e)}")
+            for result, _, _ in uploads:
+                result.update(status='failed', error="Upload failed. Please try again.")
+        else:
+            for (result, _, _), job_id in zip(uploads, job_ids):
+                result['job_id'] = job_id
+                if UPLOAD_JOBS.background:
+                    result.update(status='pending', status_url=url_for('files.upload_status', job_id=job_id))
+                    continue
+                # The batch already ran in this request, so report how it ended
+                job = UPLOAD_JOBS.status(job_id)
+                if job['status'] in ('done', 'duplicate'):
+                    result.update(status=job['status'], file_link=job['file_link'])
+                else:
+                    result.update(status='failed', error="Upload failed. Please try again.")
+            logging.info(f"{len(job_ids)} file uploads queued: {course}, {fields['file_type']}, by: {fields['uploaded_by']}")
+    
+    return results
+
+def upload_results_response(results):
+    """Per-file outcome of an upload, as JSON or as a flash message"""
+    queued = [r for r in results if r['status'] == 'pending']
+    uploaded = [r for r in results if r['status'] == 'done']
+    duplicates = [r for r in results if r['status'] == 'duplicate']
+    errors = [r for r in results if r.get('error')]
+    
+    if wants_json():
+        if queued:
+            return jsonify({'files': results}), 202
+        if uploaded or duplicates:
+            return jsonify({'files': results})
+        return jsonify({'error': errors[0]['error'], 'files': results}), 400
+    
+    messages = []
+    if len(queued) == 1:
+        messages.append("File received! It will appear in search once it finishes uploading.")
+    elif queued:
+        messages.append(f"{len(queued)} files received! They will appear in search once they finish uploading.")
+    if len(uploaded) == 1:
+        messages.append("File uploaded successfully!")
+    elif uploaded:
+        messages.append(f"{len(uploaded)} files uploaded successfully!")
+    for r in duplicates:
+        messages.append(f"{r['filename']} is already in the archive" + (f": {r['file_link']}" if r.get('file_link') else "."))
+    if len(results) == 1 and errors:
+        messages.append(errors[0]['error'])
+    else:
+        messages.extend(f"{r['filename']}: {r['error']}" for r in errors)
+    
+    session['flash_message'] = ' '.join(messages)
+    if queued or uploaded:
+        session['flash_category'] = "success"
+    elif duplicates:
+        session['flash_category'] = "info"
+    else:
+        session['flash_category'] = "danger"
+        return redirect(url_for('files.upload_file'))
+    return redirect(url_for('main.index'))
+
 @files_bp.route('/upload', methods=['GET', 'POST'])
 @login_required
 def upload_file():
     """Upload file page and handler"""
-    from app import CONNECTION_POOL
-        
     if request.method == 'POST':
         logging.debug("Processing file upload")
         # Get form data
-        course = request.form['course']
-        profs = ', '.join(request.form.getlist('profs'))
+        # Map near misses onto the catalog's spelling so professors link correctly
+        course = LOOKUP_CACHE.resolve('courses', request.form['course'])
+        prof_names = [LOOKUP_CACHE.resolve('professors', name) for name in request.form.getlist('profs')]
+        profs = ', '.join(prof_names)
         file_type = request.form['file_type']
         year = request.form['year']
         semester = request.form['semester']
@@ -216,75 +309,70 @@ def upload_file():
         
         user_email = session.get("email")
         
-        if upload_method == 'drive_link':
-            # Handle Google Drive link
-            drive_url = request.form['drive_url']
-            
-            # Validate and process Drive URL
-            file_ID, filename, file_link = process_drive_link(drive_url, course, file_type, profs, semester, year)
-            if not file_ID:
-                session['flash_message'] = "Invalid Google Drive link. Please check the URL and sharing permissions."
-                session['flash_category'] = "danger"
-                return redirect(url_for('files.upload_file'))
-        else:
-            # Handle file upload
-            file = request.files['file']
-            
-            # Validate file
-            is_valid, message = validate_file(file)
-            if not is_valid:
+        if upload_method != 'drive_link':
+            # Handle file uploads in the background: stage them and hand them to workers
+            files = [file for file in request.files.getlist('file') if file.filename]
+            if len(files) > MAX_FILES_PER_UPLOAD:
+                message = f"You can upload at most {MAX_FILES_PER_UPLOAD} files at once"
+            elif not files:
+                message = "No file selected"
+            else:
+                message = None
+            if message:
+                if wants_json():
+                    return jsonify({'error': message}), 400
                 session['flash_message'] = message
                 session['flash_category'] = "danger"
                 return redirect(url_for('files.upload_file'))
-                
-            # Create filename
-            file_extension = os.path.splitext(file.filename or '')[1]
-            filename = f"{course[:7]}-{file_type}-{profs}-{semester}-{year}{file_extension}"
             
-            try:
-                # Upload to Google Drive
-                file_ID = google_upload(file, filename)
-                file_link = google_retrieve_links(file_ID)
-            except Exception as e:
-                logging.error(f"Google Drive upload failed: {str(e)}")
-                session['flash_message'] = "Upload failed. Please try again."
-                session['flash_category'] = "danger"
-                return redirect(url_for('files.upload_file'))
+            results = queue_file_uploads(files, {
+                'course': course,
+                'prof_names': prof_names,
+                'year': year,
+                'semester': semester,
+                'file_type': file_type,
+                'uploaded_by': user_email,
+                'user_id': session.get('google_id')
+            })
+            return upload_results_response(results)
+        
+        # Handle Google Drive link
+        drive_url = request.form['drive_url']
+        
+        # Validate and process Drive URL
+        file_ID, filename, file_link, content_hash = process_drive_link(drive_url, course, file_type, profs, semester, year)
+        if not file_ID:
+            session['flash_message'] = "Invalid Google Drive link. Please check the URL and sharing permissions."
+            session['flash_category'] = "danger"
+            return redirect(url_for('files.upload_file'))
         
         try:
             # Save to database
-            with CONNECTION_POOL.getconn() as conn:
+            with get_db() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO files (filename, course, profs, year, semester, file_type, file_ID, file_link, uploaded_by) 
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ''', (filename, course, profs, year, semester, file_type, file_ID, file_link, user_email))
+                file_id = insert_file(cursor, filename, course, prof_names, year, semester, file_type, file_ID, file_link,
+                                      user_email, content_hash=content_hash)
+                existing = find_file_by_hash(cursor, content_hash) if file_id is None else None
                 conn.commit()
             
+            if existing:
+                return duplicate_response(existing)
+            
             # Add success message
-            session['flash_message'] = "Resource shared successfully!" if upload_method == 'drive_link' else "File uploaded successfully!"
+            session['flash_message'] = "Resource shared successfully!"
             session['flash_category'] = "success"
             
             # Log upload for analytics
-            logging.info(f"{'Drive link' if upload_method == 'drive_link' else 'File'} uploaded: {course}, {file_type}, by: {user_email}")
+            logging.info(f"Drive link uploaded: {course}, {file_type}, by: {user_email}")
             
             # Record upload in analytics
-            import requests
-            try:
-                file_info = {
-                    'course': course,
-                    'file_type': file_type,
-                    'professor': profs,
-                    'year': year,
-                    'semester': semester
-                }
-                requests.post(
-                    request.url_root.rstrip('/') + '/analytics/api/analytics/record-upload',
-                    json={'file_info': file_info},
-                    timeout=1  # Non-blocking
-                )
-            except Exception as e:
-                logging.error(f"Failed to record upload analytics: {str(e)}")
+            record_upload({
+                'course': course,
+                'file_type': file_type,
+                'professor': profs,
+                'year': year,
+                'semester': semester
+            })
             
             return redirect(url_for('main.index'))
         except Exception as e:
@@ -293,68 +381,59 @@ def upload_file():
             session['flash_category'] = "danger"
             return redirect(url_for('files.upload_file'))
     
-    # GET request - show upload form
-    courses = get_unique_values('courses')
-    professors = get_unique_values('professors')
-    semesters = get_unique_values('semesters')
-    file_types = get_unique_values('file_types')
-    return render_template('upload.html', 
-                          courses=courses, 
-                          professors=professors, 
-                          semesters=semesters, 
-                          file_types=file_types,
-                          current_year=2025)
+    # GET request - show upload form; the dropdowns come from lookup_options
+    return render_template('upload.html', current_year=2025)
+
+@files_bp.route('/upload/status/<job_id>')
+@login_required
+def upload_status(job_id):
+    """Progress of a background file upload"""
+    job = UPLOAD_JOBS.status(job_id)
+    # Only the uploader can see a job
+    if job is None or job.pop('uploaded_by') != session.get('email'):
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(job)
 
 @files_bp.route('/search', methods=['GET', 'POST'])
 def search():
     """Search files page and handler"""
-    from app import CONNECTION_POOL
-    
     files = []
+    next_cursor = None
+    filters = {}
     if request.method == 'POST':
         # Get search parameters
+        q = request.form.get('q', '').strip()
         course = request.form.get('course', '')
         profs = request.form.getlist('prof')
         file_type = request.form.get('file_type', '')
         year = request.form.get('year', '')
         semester = request.form.get('semester', '')
-
-        # Build query with parameters
-        query = "SELECT *, file_link FROM files WHERE 1=1"
-        search_values = []
-        
-        if course:
-            query += ' AND course=%s'
-            search_values.append(course)
-            
-        if profs:
-            query += ' AND (' + ' OR '.join(['profs LIKE %s'] * len(profs)) + ')'
-            search_values.extend([f"%{prof}%" for prof in profs])
-            
-        if year:
-            query += ' AND year=%s'
-            search_values.append(year)
-            
-        if semester:
-            query += ' AND semester=%s'
-            search_values.append(semester)
-            
-        if file_type:
-            query += ' AND file_type=%s'
-            search_values.append(file_type)
-            
-        # Add ordering
-        query += ' ORDER BY id DESC'
+        cursor = request.form.get('cursor', '')
+        page_size = parse_page_size(request.form.get('page_size', DEFAULT_PAGE_SIZE))
+        filters = {
+            'q': q,
+            'course': course,
+            'profs': profs,
+            'file_type': file_type,
+            'year': year,
+            'semester': semester,
+            'page_size': page_size
+        }
 
         # Execute search
         try:
-            with CONNECTION_POOL.getconn() as conn:
-                cursor = conn.cursor()
-                cursor.execute(query, search_values)
-                files = cursor.fetchall()
-                
+            if q:
+                # Free-text mode: ranked by relevance, a single page
+                files = rank_files(q, course, profs, file_type, year, semester, limit=page_size)
+            else:
+                files, next_cursor = search_files(course, profs, file_type, year, semester,
+                                                  cursor=cursor or None, page_size=page_size)
+            
+            # Only record the first page of a search for analytics
+            if not cursor:
                 # Log search for analytics
                 search_params = {
+                    'q': q,
                     'course': course,
                     'profs': profs,
                     'file_type': file_type, 
@@ -365,30 +444,15 @@ def search():
                 logging.info(f"Search performed: {search_params}")
                 
                 # Record search in analytics
-                import requests
-                try:
-                    requests.post(
-                        request.url_root.rstrip('/') + '/analytics/api/analytics/record-search',
-                        json={'params': search_params, 'results_count': len(files)},
-                        timeout=1  # Non-blocking
-                    )
-                except Exception as e:
-                    logging.error(f"Failed to record search analytics: {str(e)}")
+                record_search(search_params, len(files))
         except Exception as e:
             logging.error(f"Error during search: {str(e)}")
             session['flash_message'] = f"Error during search: {str(e)}"
             session['flash_category'] = "danger"
     
-    # Get data for search form
-    courses = get_unique_values('courses')
-    professors = get_unique_values('professors')
-    semesters = get_unique_values('semesters')
-    file_types = get_unique_values('file_types')
-    
+    # The search form's dropdowns come from lookup_options
     return render_template('search.html', 
-                          courses=courses, 
-                          professors=professors, 
-                          semesters=semesters, 
                           files=files, 
-                          file_types=file_types,
+                          next_cursor=next_cursor,
+                          filters=filters,
                           current_year=2025)
@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session
 import logging
+from db import get_db
 
 main_bp = Blueprint('main', __name__)
 
@@ -11,12 +12,10 @@ def index():
 @main_bp.route('/submit_suggestion', methods=['POST'])
 def submit_suggestion():
     """Handle suggestion submissions from users"""
-    from app import CONNECTION_POOL
-    
     suggestion = request.form.get('suggestion')
     if suggestion:
         try:
-            with CONNECTION_POOL.getconn() as conn:
+            with get_db() as conn:
                 cursor = conn.cursor()
                 cursor.execute('INSERT INTO suggestions (suggestion) VALUES (%s)', (suggestion,))
                 conn.commit()
@@ -49,12 +48,10 @@ def ads():
 @main_bp.route('/report_file', methods=['POST'])
 def report_file():
     """Handle file reporting by users"""
-    from app import CONNECTION_POOL
-    
     file_id = request.form.get('file_id')
     if file_id:
         try:
-            with CONNECTION_POOL.getconn() as conn:
+            with get_db() as conn:
                 cursor = conn.cursor()
                 cursor.execute('UPDATE files SET reported=TRUE WHERE id=%s', (file_id,))
                 conn.commit()
@@ -0,0 +1,111 @@
+"""Compression of dynamic responses
+
+HTML pages and JSON from the API are compressed in an after_request hook,
+with brotli when the optional brotli package is installed and the client
+accepts it, and gzip otherwise. Bodies that are small, already encoded,
+streamed, or of a type that doesn't compress are sent as they are.
+"""
+import gzip
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Types worth compressing; images other than SVG are compressed already
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+
+def choose_encoding(accept_encodings):
+    """Best content coding we can produce for an Accept-Encoding header, or None"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, level=None):
+    """``data`` compressed with ``encoding``, at the strongest level unless given"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if level is None else level)
+    # mtime=0 keeps the output, and so its ETag, identical across processes
+    return gzip.compress(data, compresslevel=9 if level is None else level, mtime=0)
+
+
+class Compression:
+    """after_request hook compressing HTML, JSON and other text responses
+
+    ``gzip_level`` and ``brotli_level`` trade CPU per request for bytes on the
+    wire; the defaults sit where further levels cost much more time for a few
+    percent smaller bodies. A response with a strong ETag has the same body
+    every time, so its compressed body is kept and reused.
+    """
+
+    def __init__(self, min_size=500, gzip_level=6, brotli_level=4, max_cached=64):
+        self.min_size = min_size
+        self.levels = {'gzip': gzip_level, 'br': brotli_level}
+        self.max_cached = max_cached
+        self._lock = threading.Lock()
+        self._cached = OrderedDict()
+
+    def init_app(self, app):
+        app.after_request(self.compress_response)
+
+    def compress_response(self, response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)
+                or response.cache_control.no_transform):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_data(self._compress_tagged(data, encoding, etag))
+            # The compressed body isn't byte-for-byte the tagged one any more
+            response.set_etag(etag, weak=True)
+        else:
+            response.set_data(compress(data, encoding, self.levels[encoding]))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _compress_tagged(self, data, encoding, etag):
+        """Compressed body for a strong ETag, compressing only on first sight"""
+        key = (request.endpoint, etag, encoding, self.levels[encoding])
+        with self._lock:
+            body = self._cached.get(key)
+            if body is not None:
+                self._cached.move_to_end(key)
+                return body
+
+        body = compress(data, encoding, self.levels[encoding])
+        with self._lock:
+            self._cached[key] = body
+            while len(self._cached) > self.max_cached:
+                self._cached.popitem(last=False)
+        return body
+
+
+COMPRESSION = Compression(
+    min_size=int(os.getenv('COMPRESS_MIN_SIZE', '500')),
+    gzip_level=int(os.getenv('COMPRESS_LEVEL', '6')),
+    brotli_level=int(os.getenv('COMPRESS_BROTLI_LEVEL', '4'))
+)
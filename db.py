@@ -1,5 +1,187 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g
+from psycopg2 import pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe, bounded Postgres connection pool with health checks and stats
+
+    Wraps psycopg2's ThreadedConnectionPool with a semaphore so callers block
+    (up to ``timeout`` seconds) instead of failing when every connection is in
+    use, and checks connections that sat idle before handing them out again.
+    No connection is opened until the first checkout, so importing the app and
+    serving requests that never touch the database stays cheap.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=20, timeout=5.0, health_check_after=30.0):
+        self.dsn = dsn
+        self.minconn = minconn
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+
+        # Stats
+        self._in_use = 0
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def getconn(self, timeout=None):
+        """Check out a healthy connection, waiting up to ``timeout`` seconds"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+
+        with self._lock:
+            self._waiting += 1
+        acquired = self._slots.acquire(timeout=timeout)
+        with self._lock:
+            self._waiting -= 1
+            if not acquired:
+                self._timeouts += 1
+
+        if not acquired:
+            raise PoolTimeout(f"No database connection available after {timeout}s")
+
+        try:
+            connections = self._get_pool()
+            conn = connections.getconn()
+            if not self._is_healthy(conn):
+                with self._lock:
+                    self._discarded += 1
+                connections.putconn(conn, close=True)
+                conn = connections.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection to the pool, rolling back any open transaction"""
+        try:
+            if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except Exception as e:
+            logger.warning(f"Discarding connection that failed to reset: {e}")
+            close = True
+
+        close = close or bool(conn.closed)
+        with self._lock:
+            if close:
+                self._last_used.pop(id(conn), None)
+                self._discarded += 1
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+            self._in_use -= 1
+
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a transaction block"""
+        conn = self.getconn()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.putconn(conn)
+
+    def _get_pool(self):
+        """The underlying psycopg2 pool, opening its first connections on first use"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = pool.ThreadedConnectionPool(self.minconn, self.maxconn, self.dsn)
+            return self._pool
+
+    def _is_healthy(self, conn):
+        """Cheap liveness check, only pinging connections that sat idle for a while"""
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def stats(self):
+        """Snapshot of pool usage for sizing under load"""
+        with self._lock:
+            return {
+                'max_size': self.maxconn,
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'avg_checkout_ms': round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'max_checkout_ms': round(self._wait_max * 1000, 3),
+            }
+
+    def closeall(self):
+        with self._lock:
+            connections, self._pool = self._pool, None
+        if connections is not None:
+            connections.closeall()
+
+
+def get_db():
+    """Return the connection checked out for the current request
+
+    The first call in a request checks a connection out of the pool and keeps it
+    on the app context; ``close_db`` hands it back when the context tears down.
+    """
+    if 'db_conn' not in g:
+        g.db_conn = current_app.config['CONNECTION_POOL'].getconn()
+    return g.db_conn
+
+
+def close_db(exception=None):
+    """Return the request's connection to the pool"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        current_app.config['CONNECTION_POOL'].putconn(conn)
+
+
+def init_app(app):
+    """Register the request-scoped connection teardown on the app"""
+    app.teardown_appcontext(close_db)
+
+
 def init_db(CONNECTION_POOL):
-    with CONNECTION_POOL.getconn() as conn:
+    with CONNECTION_POOL.connection() as conn:
         cursor = conn.cursor()
         # File Metadata Table
         cursor.execute('''
@@ -19,113 +201,271 @@ def init_db(CONNECTION_POOL):
         ''')
         print('File Table Created')
 
-        # Course Table
+        # Full-text search vector over course, professors, file type and filename
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS courses (
-                id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL
-            )
+            ALTER TABLE files ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', coalesce(course, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(profs, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(file_type, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(filename, '')), 'C')
+            ) STORED
         ''')
-        print('Course Table Created')
+        cursor.execute('CREATE INDEX IF NOT EXISTS files_search_vector_idx ON files USING GIN (search_vector)')
+
+        # Trigram index for partial course codes; pg_trgm may not be available everywhere
+        cursor.execute('SAVEPOINT trgm')
+        try:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            cursor.execute('CREATE INDEX IF NOT EXISTS files_course_trgm_idx ON files USING GIN (course gin_trgm_ops)')
+            cursor.execute('RELEASE SAVEPOINT trgm')
+        except Exception as e:
+            cursor.execute('ROLLBACK TO SAVEPOINT trgm')
+            print(f'Skipping trigram index, pg_trgm unavailable: {e}')
+        print('File Search Indexes Created')
 
-        # Professors Table
+        # SHA-256 of the uploaded content, so the same file is only stored once
+        cursor.execute('ALTER TABLE files ADD COLUMN IF NOT EXISTS content_hash TEXT')
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS professors (
-                id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL
-            )
+            CREATE UNIQUE INDEX IF NOT EXISTS files_content_hash_key ON files (content_hash)
+            WHERE content_hash IS NOT NULL
         ''')
-        print('Professors Table Created')
+        print('File Content Hash Index Created')
 
-        # File Types Table
+        # Lookup Tables; unique names keep seeding and concurrent deploys idempotent
         cursor.execute('''
+            CREATE TABLE IF NOT EXISTS courses (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS professors (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
             CREATE TABLE IF NOT EXISTS file_types (
                 id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL
-            )
-        ''')
-        print('File Types Table Created')
-
-        # Years Table
-        cursor.execute('''
+                name TEXT NOT NULL UNIQUE
+            );
             CREATE TABLE IF NOT EXISTS years (
                 id SERIAL PRIMARY KEY,
                 name INTEGER NOT NULL  -- Changed from TEXT to INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS semesters (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS suggestions (
+                id SERIAL PRIMARY KEY,
+                suggestion TEXT NOT NULL
             )
         ''')
-        print('Years Table Created')
+        print('Lookup Tables Created')
 
-        # Semesters Table
+        # File <-> Professor association table
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS semesters (
-                id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL
+            CREATE TABLE IF NOT EXISTS file_professors (
+                file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+                professor_id INTEGER NOT NULL REFERENCES professors(id) ON DELETE CASCADE,
+                PRIMARY KEY (file_id, professor_id)
+            );
+            CREATE INDEX IF NOT EXISTS file_professors_professor_id_idx ON file_professors (professor_id, file_id)
+        ''')
+        print('File Professors Table Created')
+
+        # Upload Jobs Table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS upload_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL DEFAULT 'pending',
+                staged_path TEXT NOT NULL,
+                original_name TEXT NOT NULL,
+                metadata JSONB NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                drive_file_id TEXT,
+                file_link TEXT,
+                file_id INTEGER REFERENCES files(id) ON DELETE SET NULL,
+                error TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
             )
         ''')
-        print('Semesters Table Created')
+        cursor.execute("CREATE INDEX IF NOT EXISTS upload_jobs_pending_idx ON upload_jobs (created_at) WHERE status = 'pending'")
+        print('Upload Jobs Table Created')
 
-        # Suggestions Table
+        # Analytics Tables
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS suggestions (
-                id SERIAL PRIMARY KEY,
-                suggestion TEXT NOT NULL
+            CREATE TABLE IF NOT EXISTS analytics_page_views (
+                id BIGSERIAL PRIMARY KEY,
+                page TEXT NOT NULL,
+                user_id TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            CREATE TABLE IF NOT EXISTS analytics_searches (
+                id BIGSERIAL PRIMARY KEY,
+                params JSONB NOT NULL,
+                results_count INTEGER NOT NULL,
+                user_id TEXT,
+                user_email TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            CREATE TABLE IF NOT EXISTS analytics_uploads (
+                id BIGSERIAL PRIMARY KEY,
+                file_info JSONB NOT NULL,
+                user_id TEXT,
+                user_email TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            CREATE TABLE IF NOT EXISTS analytics_events (
+                id BIGSERIAL PRIMARY KEY,
+                event_type TEXT NOT NULL,
+                event_data JSONB NOT NULL,
+                user_id TEXT,
+                user_email TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            CREATE TABLE IF NOT EXISTS analytics_users (
+                user_id TEXT PRIMARY KEY,
+                email TEXT,
+                name TEXT,
+                first_seen TIMESTAMPTZ NOT NULL,
+                last_seen TIMESTAMPTZ NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS analytics_counters (
+                metric TEXT NOT NULL,
+                key TEXT NOT NULL DEFAULT '',
+                count BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (metric, key)
             )
         ''')
-        print('Suggestions Table Created')
-        
-        cursor.execute('SELECT COUNT(*) FROM professors')
-        count = cursor.fetchone()[0]
-        if count == 0:
-            files = ['Names/names SBA.txt', 'Names/names CEN.txt', 'Names/names CAS.txt', 'Names/names CAAD.txt']
-            done_name = []
-            for i in files:
-                with open(i, 'r') as file:
-                    names = file.readlines()
-                    for name in names:
-                        name = name.strip()                    
-                        if name:  
-                            if name not in done_name: 
-                                done_name.append(name)
-                                cursor.execute('INSERT INTO professors (name) VALUES (%s)', (name,))
-
-        cursor.execute('SELECT COUNT(*) FROM courses')
-        count = cursor.fetchone()[0]
-        if count == 0:
-            files = ['Names/Courses.txt']
-            done_name = []
-            for i in files:
-                with open(i, 'r') as file:
-                    names = file.readlines()
-                    for name in names:
-                        name = name.strip()                    
-                        if name:  
-                            if name not in done_name: 
-                                done_name.append(name)
-                                cursor.execute('INSERT INTO courses (name) VALUES (%s)', (name,))
+        print('Analytics Tables Created')
         
-        cursor.execute('SELECT COUNT(*) FROM semesters') 
-        count = cursor.fetchone()[0]
-        if count == 0:
-            files = ['Fall', 'Spring', 'Summer', 'Unkown']
-            for name in files:
-                cursor.execute('INSERT INTO semesters (name) VALUES (%s)', (name,))
-        
-        cursor.execute('SELECT COUNT(*) FROM file_types')
-        count = cursor.fetchone()[0]
-        if count == 0:
-            files = ['Midterm 1', 'Midterm 2', 'Midterm 3', 'Final', 'Quiz', 'Assignment', 'Notes', 'Syllabus', 'Book', 'Book Answer Key','Others']
-            for name in files:
-                cursor.execute('INSERT INTO file_types (name) VALUES (%s)', (name,))
+        # Seed the lookup tables, one statement per table
+        professors = read_names(['Names/names SBA.txt', 'Names/names CEN.txt', 'Names/names CAS.txt', 'Names/names CAAD.txt'])
+        print(f'Professors seeded: {seed_lookup(cursor, "professors", professors)}')
+        print(f'Courses seeded: {seed_lookup(cursor, "courses", read_names(["Names/Courses.txt"]))}')
+        print(f'Semesters seeded: {seed_lookup(cursor, "semesters", ["Fall", "Spring", "Summer", "Unkown"])}')
+        file_types = ['Midterm 1', 'Midterm 2', 'Midterm 3', 'Final', 'Quiz', 'Assignment', 'Notes', 'Syllabus', 'Book', 'Book Answer Key', 'Others']
+        print(f'File Types seeded: {seed_lookup(cursor, "file_types", file_types)}')
+
+        backfill_file_professors(cursor)
+
+
+def read_names(paths):
+    """Non-empty, stripped lines of the given name files"""
+    names = []
+    for path in paths:
+        with open(path, 'r') as file:
+            names.extend(line.strip() for line in file)
+    return [name for name in names if name]
+
+
+def seed_lookup(cursor, table, names):
+    """Add the names missing from a lookup table in one statement
+
+    Duplicates are dropped while keeping first-seen order, so ids follow the
+    seed files. Names already present are skipped both by the NOT EXISTS check
+    (for tables created before names were unique) and by ON CONFLICT.
+    Returns how many names were added.
+    """
+    cursor.execute(f'''
+        INSERT INTO {table} (name)
+        SELECT seed.name FROM unnest(%s::text[]) WITH ORDINALITY AS seed (name, position)
+        WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.name = seed.name)
+        ORDER BY seed.position
+        ON CONFLICT DO NOTHING
+    ''', (list(dict.fromkeys(names)),))
+    return cursor.rowcount
+
+
+def insert_file(cursor, filename, course, prof_names, year, semester, file_type, file_ID, file_link, uploaded_by,
+                content_hash=None):
+    """Insert a files row and its professor links, returning the new id
+
+    Returns None without inserting if a file with the same content hash exists.
+    """
+    return insert_files(cursor, [{
+        'filename': filename,
+        'course': course,
+        'prof_names': prof_names,
+        'year': year,
+        'semester': semester,
+        'file_type': file_type,
+        'file_ID': file_ID,
+        'file_link': file_link,
+        'uploaded_by': uploaded_by,
+        'content_hash': content_hash
+    }])[0]
+
+
+def insert_files(cursor, rows):
+    """Insert files rows and their professor links with one statement each
+
+    ``rows`` are dicts of files columns plus ``prof_names``. Returns the new
+    ids in the same order, with None for rows whose content hash already exists.
+    """
+    if not rows:
+        return []
+    inserted = execute_values(cursor, '''
+        INSERT INTO files (filename, course, profs, year, semester, file_type, file_ID, file_link, uploaded_by, content_hash)
+        VALUES %s
+        ON CONFLICT (content_hash) WHERE content_hash IS NOT NULL DO NOTHING
+        RETURNING id, file_ID
+    ''', [
+        (r['filename'], r['course'], ', '.join(r['prof_names']), r['year'], r['semester'], r['file_type'],
+         r['file_ID'], r['file_link'], r['uploaded_by'], r.get('content_hash'))
+        for r in rows
+    ], page_size=len(rows), fetch=True)
+
+    # Drive ids are unique per upload, so they map returned ids back to rows
+    ids_by_drive_id = {file_ID: file_id for file_id, file_ID in inserted}
+    file_ids = [ids_by_drive_id.pop(r['file_ID'], None) for r in rows]
+
+    links = [(file_id, name) for file_id, r in zip(file_ids, rows) if file_id for name in r['prof_names']]
+    if links:
+        execute_values(cursor, '''
+            INSERT INTO file_professors (file_id, professor_id)
+            SELECT v.file_id, p.id FROM (VALUES %s) AS v (file_id, name)
+            JOIN professors p ON p.name = v.name
+            ON CONFLICT DO NOTHING
+        ''', links, page_size=len(links))
+    return file_ids
+
+
+def find_file_by_hash(cursor, content_hash):
+    """(id, file_link) of the file with this content hash, or None"""
+    if not content_hash:
+        return None
+    cursor.execute('SELECT id, file_link FROM files WHERE content_hash = %s', (content_hash,))
+    return cursor.fetchone()
+
+
+def backfill_file_professors(cursor):
+    """Populate file_professors from the comma-joined files.profs strings
+
+    Only files without any association yet are considered, so re-running this
+    is cheap once the table has been backfilled.
+    """
+    cursor.execute('''
+        INSERT INTO file_professors (file_id, professor_id)
+        SELECT f.id, p.id
+        FROM files f
+        CROSS JOIN LATERAL regexp_split_to_table(f.profs, ',') AS prof(name)
+        JOIN professors p ON p.name = trim(prof.name)
+        WHERE NOT EXISTS (SELECT 1 FROM file_professors fp WHERE fp.file_id = f.id)
+        ON CONFLICT DO NOTHING
+    ''')
+    print(f'File Professors backfilled: {cursor.rowcount} links')
 
 
 if __name__ == '__main__':
     import os
-    from psycopg2 import pool
     from dotenv import load_dotenv
     load_dotenv("lock.env")
     CONNECTION_STRING = os.getenv('DATABASE_URL')
-    CONNECTION_POOL = pool.SimpleConnectionPool(1, 250, CONNECTION_STRING)
+    CONNECTION_POOL = ConnectionPool(CONNECTION_STRING, 1, 2)
     if CONNECTION_POOL:
         print('Connection pool created successfully')
     init_db(CONNECTION_POOL)
+    from migrations import migrate
+    print(f'Migrations applied: {migrate(CONNECTION_POOL)}')
     CONNECTION_POOL.closeall()
\ No newline at end of file
@@ -0,0 +1,259 @@
+import datetime
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Chunk size for resumable Drive uploads (must be a multiple of 256KB);
+# bounds how much of an upload is held in memory at once
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+
+# Permission that makes a file readable by anyone with the link
+PUBLIC_READ = {'type': 'anyone', 'role': 'reader'}
+
+# Drive accepts at most 100 calls in one batch request
+MAX_BATCH_SIZE = 100
+
+
+def load_credentials():
+    """Load the Drive service account credentials"""
+    # The Google client stack is slow to import, so it loads on first use
+    from google.oauth2 import service_account
+
+    SCOPES = os.getenv("DRIVE_SCOPES", "").split(",")
+    try:
+        # Try to use helper function first (supports both local and Vercel)
+        from app import get_service_account_credentials
+        credentials_data = get_service_account_credentials()
+        if credentials_data:
+            return service_account.Credentials.from_service_account_info(credentials_data, scopes=SCOPES)
+    except Exception as e:
+        logger.error(f"Failed to get credentials from helper function: {e}")
+
+    # Fallback to local file approach
+    SERVICE_ACCOUNT_FILE = os.getenv("SERVICE_ACCOUNT_FILE")
+    if SERVICE_ACCOUNT_FILE and os.path.exists(SERVICE_ACCOUNT_FILE):
+        return service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+
+    raise Exception("No service account credentials found")
+
+
+class DriveClient:
+    """Process-wide Drive API client holder
+
+    Credentials are loaded once and refreshed only when the token is within
+    ``refresh_margin`` seconds of expiry. Each thread gets its own service
+    object on top of a persistent httplib2 connection, since neither is safe to
+    share between threads. Every API call made through ``execute`` is timed.
+    Nothing from the Google client libraries is imported until first use, so
+    requests that never touch Drive don't pay for loading them.
+    """
+
+    def __init__(self, refresh_margin=300, http_timeout=60):
+        self.refresh_margin = refresh_margin
+        self.http_timeout = http_timeout
+        self._credentials = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def credentials(self):
+        """Cached credentials with a token valid for at least ``refresh_margin`` seconds"""
+        from google.auth.transport.requests import Request
+
+        with self._lock:
+            if self._credentials is None:
+                self._credentials = load_credentials()
+
+            creds = self._credentials
+            expiry = creds.expiry
+            margin = datetime.timedelta(seconds=self.refresh_margin)
+            if not creds.token or expiry is None or expiry - datetime.datetime.utcnow() < margin:
+                with self.timed('token_refresh'):
+                    creds.refresh(Request())
+            return creds
+
+    def service(self):
+        """This thread's Drive v3 service object"""
+        creds = self.credentials()
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            import google_auth_httplib2
+            import httplib2
+            from googleapiclient.discovery import build
+
+            http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=self.http_timeout))
+            service = build('drive', 'v3', http=http, cache_discovery=False)
+            self._local.service = service
+        return service
+
+    def execute(self, request, name):
+        """Execute an API request, recording how long it took under ``name``"""
+        with self.timed(name):
+            return request.execute()
+
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            logger.debug(f"Drive {name} took {elapsed * 1000:.1f}ms")
+            with self._stats_lock:
+                count, total, slowest = self._stats.get(name, (0, 0.0, 0.0))
+                self._stats[name] = (count + 1, total + elapsed, max(slowest, elapsed))
+
+    def stats(self):
+        """Call counts and latencies per Drive operation
+
+        ``calls_per_upload`` is the number of HTTP round trips to the API
+        (token refreshes excluded) per file created; a batch counts as one.
+        """
+        with self._stats_lock:
+            stats = {
+                name: {
+                    'calls': count,
+                    'avg_ms': round(total / count * 1000, 1),
+                    'max_ms': round(slowest * 1000, 1)
+                }
+                for name, (count, total, slowest) in self._stats.items()
+            }
+        uploads = stats.get('files.create', {}).get('calls', 0)
+        round_trips = sum(op['calls'] for name, op in stats.items() if name != 'token_refresh')
+        return {
+            'operations': stats,
+            'calls_per_upload': round(round_trips / uploads, 2) if uploads else None
+        }
+
+
+class PermissionBatcher:
+    """Coalesces public-read grants from concurrent uploads into batch requests
+
+    The first caller to arrive waits up to ``max_wait`` seconds (or until
+    ``max_batch`` grants are queued) and then sends every queued grant in one
+    Drive batch HTTP request; the other callers just wait for their result. A
+    lone upload pays ``max_wait`` and a plain request, nothing more.
+    """
+
+    def __init__(self, client, max_batch=MAX_BATCH_SIZE, max_wait=0.05, timeout=120):
+        self.client = client
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._pending = []
+        self._lock = threading.Lock()
+        self._full = threading.Event()
+
+    def grant(self, file_id):
+        """Make a file readable by anyone with the link, blocking until done"""
+        future = Future()
+        with self._lock:
+            self._pending.append((file_id, future))
+            leader = len(self._pending) == 1
+            if len(self._pending) >= self.max_batch:
+                self._full.set()
+
+        if leader:
+            self._full.wait(self.max_wait)
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._full.clear()
+            for i in range(0, len(pending), self.max_batch):
+                self._send(pending[i:i + self.max_batch])
+
+        # Bounded, so a leader that dies mid-send can't hold this thread forever
+        return future.result(timeout=self.timeout)
+
+    def _send(self, grants):
+        """Send queued grants, settling every future whatever goes wrong"""
+        try:
+            service = self.client.service()
+
+            if len(grants) == 1:
+                file_id, future = grants[0]
+                request = service.permissions().create(fileId=file_id, body=PUBLIC_READ, fields='id')
+                future.set_result(self.client.execute(request, 'permissions.create'))
+                return
+
+            def callback(request_id, response, exception):
+                future = grants[int(request_id)][1]
+                if exception is not None:
+                    future.set_exception(exception)
+                else:
+                    future.set_result(response)
+
+            batch = service.new_batch_http_request(callback=callback)
+            for i, (file_id, _) in enumerate(grants):
+                batch.add(service.permissions().create(fileId=file_id, body=PUBLIC_READ, fields='id'),
+                          request_id=str(i))
+            self.client.execute(batch, 'permissions.batch')
+        except Exception as e:
+            logger.error(f"Drive request for {len(grants)} permission grants failed: {e}")
+            error = e
+        else:
+            error = RuntimeError("Drive batch returned no response for this permission grant")
+
+        # Callers block on these futures, so none may be left unsettled
+        for _, future in grants:
+            if not future.done():
+                future.set_exception(error)
+
+
+DRIVE = DriveClient(refresh_margin=int(os.getenv('DRIVE_TOKEN_REFRESH_MARGIN', '300')))
+PERMISSIONS = PermissionBatcher(DRIVE, max_wait=float(os.getenv('DRIVE_BATCH_WINDOW', '0.05')),
+                                timeout=float(os.getenv('DRIVE_GRANT_TIMEOUT', '120')))
+
+
+def google_upload(stream, file_name, mimetype='application/octet-stream'):
+    """Upload a binary stream to Google Drive, returning its id and web link"""
+    from googleapiclient.http import MediaIoBaseUpload
+
+    PARENT_FOLDER_ID = os.getenv("PARENT_FOLDER_ID")
+
+    service = DRIVE.service()
+
+    file_metadata = {
+        'name': file_name,
+        'parents': [PARENT_FOLDER_ID]
+    }
+
+    # Stream straight from the source in chunks instead of copying it into memory
+    stream.seek(0)
+    media = MediaIoBaseUpload(stream, mimetype=mimetype, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+
+    try:
+        logger.debug("Uploading file to Google Drive")
+        # Ask for the link up front to save a files.get round trip
+        request = service.files().create(body=file_metadata, media_body=media, fields='id,webViewLink')
+        file = DRIVE.execute(request, 'files.create')
+        logger.debug('File ID: %s', file.get('id'))
+        return file.get('id'), file.get('webViewLink')
+    except Exception as e:
+        logger.error("An error occurred during file upload: %s", e)
+        raise
+
+
+def google_share(file_ID):
+    """Make an uploaded file publicly readable, batched with concurrent uploads"""
+    logger.debug("Sharing uploaded file")
+    PERMISSIONS.grant(file_ID)
+
+
+def google_delete(file_ID):
+    """Permanently delete a file from Drive"""
+    service = DRIVE.service()
+    DRIVE.execute(service.files().delete(fileId=file_ID, supportsAllDrives=True), 'files.delete')
+
+
+def google_retrieve_links(file_ID):
+    """Share a file and retrieve its link, for files whose link isn't known yet"""
+    google_share(file_ID)
+    service = DRIVE.service()
+    file = DRIVE.execute(service.files().get(fileId=file_ID, fields='webViewLink'), 'files.get')
+    return file['webViewLink']
@@ -0,0 +1,265 @@
+"""Import every file in a Google Drive folder tree into the archive
+
+Metadata is read from file names that follow the archive's own convention,
+"<course code>-<file type>-<professors>-<semester>-<year>.<ext>", with the
+command line options filling in whatever a name doesn't provide. Each page
+of up to 1000 files is loaded with COPY into a temporary table and moved
+into files with one INSERT ... SELECT, skipping files already imported.
+Progress is saved to a checkpoint file after every page, so an interrupted
+import picks up where it stopped when run again.
+
+    python import_drive.py https://drive.google.com/drive/folders/FOLDER_ID --share
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from blueprints.files import extract_drive_file_id
+from db import ConnectionPool
+from drive import DRIVE, MAX_BATCH_SIZE, google_share
+
+logger = logging.getLogger(__name__)
+
+FOLDER_MIMETYPE = 'application/vnd.google-apps.folder'
+
+# Only what the import needs, to keep list responses small
+LIST_FIELDS = 'nextPageToken, files(id, name, mimeType, webViewLink, sha256Checksum)'
+PAGE_SIZE = 1000
+
+IMPORT_COLUMNS = ('filename', 'course', 'profs', 'year', 'semester', 'file_type', 'file_ID', 'file_link',
+                  'uploaded_by', 'content_hash')
+
+
+class NameParser:
+    """Parses archive file names against the current lookup tables"""
+
+    def __init__(self, courses, file_types, semesters, defaults):
+        # Names are built from the first 7 characters of the course, e.g. "COE 241"
+        self.courses = {name[:7]: name for name in courses}
+        # Longest first, so "Book Answer Key" wins over "Book"
+        self.file_types = sorted(file_types, key=len, reverse=True)
+        self.term = re.compile(r'-(%s)-(\d{4})(?:-|$)' % '|'.join(re.escape(name) for name in semesters))
+        self.defaults = defaults
+
+    @classmethod
+    def from_db(cls, cursor, defaults):
+        names = {}
+        for table in ('courses', 'file_types', 'semesters'):
+            cursor.execute(f'SELECT name FROM {table}')
+            names[table] = [row[0] for row in cursor.fetchall()]
+        return cls(names['courses'], names['file_types'], names['semesters'], defaults)
+
+    def parse(self, name):
+        """Metadata dict for a file name, or None if a required field is missing"""
+        stem = os.path.splitext(name)[0]
+        parsed = {}
+
+        code, _, rest = stem.partition('-')
+        if code in self.courses:
+            parsed['course'] = self.courses[code]
+            file_type = next((t for t in self.file_types if rest.startswith(t + '-')), None)
+            if file_type:
+                parsed['file_type'] = file_type
+                rest = rest[len(file_type) + 1:]
+                # Leading "-" so the term still matches when there are no professors
+                term = self.term.search('-' + rest)
+                if term:
+                    parsed['semester'], parsed['year'] = term.group(1), int(term.group(2))
+                    profs = rest[:max(term.start() - 1, 0)]
+                    if profs:
+                        parsed['profs'] = profs
+
+        metadata = dict(self.defaults, **parsed)
+        if not all(metadata.get(key) for key in ('course', 'file_type', 'profs', 'semester', 'year')):
+            return None
+        return metadata
+
+
+def list_folder(folder_id, page_token=None):
+    """One page of a folder's direct children"""
+    service = DRIVE.service()
+    request = service.files().list(
+        q=f"'{folder_id}' in parents and trashed = false",
+        pageSize=PAGE_SIZE,
+        pageToken=page_token,
+        fields=LIST_FIELDS,
+        supportsAllDrives=True,
+        includeItemsFromAllDrives=True
+    )
+    return DRIVE.execute(request, 'files.list')
+
+
+def copy_rows(cursor, rows):
+    """Bulk-insert new files rows through a COPY into a temporary table
+
+    Returns how many rows were inserted; rows whose Drive file or content hash
+    is already in the archive are skipped.
+    """
+    cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS import_files (
+            filename TEXT, course TEXT, profs TEXT, year INTEGER, semester TEXT, file_type TEXT,
+            file_ID TEXT, file_link TEXT, uploaded_by TEXT, content_hash TEXT
+        ) ON COMMIT DELETE ROWS
+    ''')
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in IMPORT_COLUMNS])
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY import_files ({', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+    # Insert the new files and link their professors in one statement
+    cursor.execute(f'''
+        WITH inserted AS (
+            INSERT INTO files ({', '.join(IMPORT_COLUMNS)})
+            SELECT {', '.join(IMPORT_COLUMNS)} FROM import_files i
+            WHERE NOT EXISTS (SELECT 1 FROM files f WHERE f.file_ID = i.file_ID)
+            ON CONFLICT (content_hash) WHERE content_hash IS NOT NULL DO NOTHING
+            RETURNING id, profs
+        ), linked AS (
+            INSERT INTO file_professors (file_id, professor_id)
+            SELECT inserted.id, p.id
+            FROM inserted
+            CROSS JOIN LATERAL regexp_split_to_table(inserted.profs, ',') AS prof(name)
+            JOIN professors p ON p.name = trim(prof.name)
+            ON CONFLICT DO NOTHING
+        )
+        SELECT count(*) FROM inserted
+    ''')
+    return cursor.fetchone()[0]
+
+
+def load_checkpoint(path, root_folder):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            state = json.load(f)
+        if state['root'] == root_folder:
+            logger.info(f"Resuming import from {path}: {len(state['folders'])} folders left")
+            return state
+        logger.warning(f"Ignoring checkpoint {path}, it is for folder {state['root']}")
+    return {
+        'root': root_folder,
+        'folders': [root_folder],
+        'seen_folders': [root_folder],
+        'page_token': None,
+        'totals': {'folders': 0, 'files': 0, 'imported': 0, 'existing': 0, 'unparsed': 0}
+    }
+
+
+def save_checkpoint(path, state):
+    if not path:
+        return
+    # Write then rename, so a crash never leaves a half-written checkpoint
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def run_import(pool, root_folder, parser, uploaded_by, checkpoint=None, share=False, dry_run=False):
+    """Walk the folder tree page by page; returns the running totals"""
+    state = load_checkpoint(checkpoint, root_folder)
+    totals = state['totals']
+    seen_folders = set(state['seen_folders'])
+    sharer = ThreadPoolExecutor(max_workers=MAX_BATCH_SIZE) if share else None
+
+    try:
+        while state['folders']:
+            folder_id = state['folders'][0]
+            page = list_folder(folder_id, state['page_token'])
+
+            rows = []
+            for item in page.get('files', []):
+                if item['mimeType'] == FOLDER_MIMETYPE:
+                    if item['id'] not in seen_folders:
+                        seen_folders.add(item['id'])
+                        state['folders'].append(item['id'])
+                    continue
+
+                totals['files'] += 1
+                metadata = parser.parse(item['name'])
+                if metadata is None:
+                    totals['unparsed'] += 1
+                    logger.debug(f"Skipping {item['name']}: name doesn't follow the archive convention")
+                    continue
+                rows.append(dict(metadata,
+                                 filename=item['name'],
+                                 file_ID=item['id'],
+                                 file_link=item['webViewLink'],
+                                 uploaded_by=uploaded_by,
+                                 content_hash=item.get('sha256Checksum')))
+
+            if rows and not dry_run:
+                if sharer:
+                    # Concurrent grants are coalesced into Drive batch requests
+                    list(sharer.map(google_share, [row['file_ID'] for row in rows]))
+                with pool.connection() as conn:
+                    imported = copy_rows(conn.cursor(), rows)
+                totals['imported'] += imported
+                totals['existing'] += len(rows) - imported
+
+            state['page_token'] = page.get('nextPageToken')
+            if not state['page_token']:
+                state['folders'].pop(0)
+                totals['folders'] += 1
+            state['seen_folders'] = list(seen_folders)
+            save_checkpoint(checkpoint, state)
+            logger.info(f"{totals['files']} files listed, {totals['imported']} imported, "
+                        f"{len(state['folders'])} folders queued")
+    finally:
+        if sharer:
+            sharer.shutdown()
+
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('folder', help='Drive folder URL or ID')
+    parser.add_argument('--checkpoint', default='import_drive.checkpoint.json',
+                        help='file used to resume an interrupted import (default: %(default)s)')
+    parser.add_argument('--uploaded-by', default='drive-import', help='uploaded_by value for imported files')
+    parser.add_argument('--share', action='store_true', help='make imported files readable by anyone with the link')
+    parser.add_argument('--dry-run', action='store_true', help='list and parse files without importing them')
+    parser.add_argument('--course', help='course for files whose names lack one')
+    parser.add_argument('--file-type', help='file type for files whose names lack one')
+    parser.add_argument('--profs', help='comma-separated professors for files whose names lack them')
+    parser.add_argument('--semester', help='semester for files whose names lack one')
+    parser.add_argument('--year', type=int, help='year for files whose names lack one')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv("lock.env")
+
+    root_folder = extract_drive_file_id(args.folder) or args.folder
+    defaults = {
+        'course': args.course,
+        'file_type': args.file_type,
+        'profs': args.profs,
+        'semester': args.semester,
+        'year': args.year
+    }
+
+    pool = ConnectionPool(os.getenv('DATABASE_URL'), 1, 2)
+    try:
+        with pool.connection() as conn:
+            name_parser = NameParser.from_db(conn.cursor(), {k: v for k, v in defaults.items() if v})
+        totals = run_import(pool, root_folder, name_parser, args.uploaded_by,
+                            checkpoint=args.checkpoint, share=args.share, dry_run=args.dry_run)
+    finally:
+        pool.closeall()
+
+    print(f"{totals['folders']} folders, {totals['files']} files: {totals['imported']} imported, "
+          f"{totals['existing']} already in the archive, {totals['unparsed']} with unrecognised names")
+    print(f"Drive: {DRIVE.stats()['operations']}")
+
+
+if __name__ == '__main__':
+    main()
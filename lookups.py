@@ -0,0 +1,276 @@
+import hashlib
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from markupsafe import Markup, escape
+
+from db import get_db
+
+logger = logging.getLogger(__name__)
+
+# Tables behind the course/professor/semester/file type dropdowns
+LOOKUP_TABLES = ('courses', 'professors', 'semesters', 'file_types')
+
+
+def fingerprint(names):
+    """Short digest of a list of names, which changes whenever the list does"""
+    return hashlib.sha1('\n'.join(names).encode('utf-8')).hexdigest()[:16]
+
+
+def normalize(text):
+    """Lowercase words of a name or query, ignoring punctuation"""
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+class PrefixIndex:
+    """Sorted arrays answering typeahead queries over a list of names
+
+    A name matches when it starts with the query, or when every word of the
+    query is the start of one of its words ("calc 1" finds
+    "MTH 103 - Calculus I"). Both lookups are binary searches, so a query costs
+    the same whether the table has ten names or ten thousand.
+    """
+
+    def __init__(self, names):
+        entries = sorted((normalize(name), name) for name in names)
+        self.keys = [key for key, _ in entries]
+        self.names = [name for _, name in entries]
+        # (word, position) for every word of every name, sorted by word
+        words = sorted({(word, i) for i, key in enumerate(self.keys) for word in key.split()})
+        self.words = [word for word, _ in words]
+        self.positions = [i for _, i in words]
+
+    def search(self, query, limit=20):
+        """Up to ``limit`` names matching ``query``, whole-name prefix matches first"""
+        terms = normalize(query).split()
+        if not terms:
+            return self.names[:limit]
+
+        phrase = ' '.join(terms)
+        matches = []
+        i = bisect_left(self.keys, phrase)
+        while i < len(self.keys) and len(matches) < limit and self.keys[i].startswith(phrase):
+            matches.append(i)
+            i += 1
+
+        if len(matches) < limit:
+            candidates = None
+            for term in terms:
+                found = self._word_prefix(term)
+                candidates = found if candidates is None else candidates & found
+                if not candidates:
+                    break
+            candidates.difference_update(matches)
+            matches.extend(heapq.nsmallest(limit - len(matches), candidates))
+        return [self.names[i] for i in matches]
+
+    def _word_prefix(self, prefix):
+        """Positions of the names with a word starting with ``prefix``"""
+        start = bisect_left(self.words, prefix)
+        end = bisect_left(self.words, prefix + '\uffff', start)
+        return set(self.positions[start:end])
+
+
+def trigrams(text):
+    """pg_trgm-style trigrams of each word, with doubled letters folded
+
+    Folding runs of a letter makes common transliteration variants such as
+    "Mohammed" and "Mohamed" share all their trigrams.
+    """
+    grams = set()
+    for word in re.sub(r'(\w)\1+', r'\1', normalize(text)).split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """Inverted trigram index for matching misspelled names
+
+    A query is scored only against the names that share at least one of its
+    trigrams. ``search`` ranks them by the fraction of the query's trigrams
+    each name contains, which suits partial input; ``closest`` uses the
+    symmetric pg_trgm similarity, which only a near-complete spelling of a
+    name scores highly on.
+    """
+
+    def __init__(self, names, threshold=0.5):
+        self.names = list(names)
+        self.threshold = threshold
+        self.sizes = []
+        self.postings = defaultdict(list)
+        for i, name in enumerate(self.names):
+            grams = trigrams(name)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(i)
+
+    def search(self, query, limit=5):
+        """Up to ``limit`` names containing most of ``query``, best match first"""
+        size, hits = self._hits(query)
+        scored = (
+            (count / size, self._similarity(size, i, count), -i)
+            for i, count in hits.items() if count >= self.threshold * size
+        )
+        return [self.names[-i] for _, _, i in heapq.nlargest(limit, scored)]
+
+    def closest(self, query, threshold, margin):
+        """The name most similar to ``query`` as a whole, or None
+
+        The best name must reach ``threshold`` similarity and beat the
+        runner-up by ``margin``, so ambiguous input never picks one name.
+        """
+        size, hits = self._hits(query)
+        scored = heapq.nlargest(2, ((self._similarity(size, i, count), i) for i, count in hits.items()))
+        if not scored or scored[0][0] < threshold:
+            return None
+        if len(scored) > 1 and scored[0][0] - scored[1][0] < margin:
+            return None
+        return self.names[scored[0][1]]
+
+    def _hits(self, query):
+        """(trigram count of ``query``, shared trigram count per name position)"""
+        # Too short to say anything about similarity
+        if len(normalize(query)) < 3:
+            return 0, Counter()
+        grams = trigrams(query)
+        hits = Counter()
+        for gram in grams:
+            hits.update(self.postings.get(gram, ()))
+        return len(grams), hits
+
+    def _similarity(self, size, i, count):
+        """Shared trigrams over all distinct trigrams of the query and name ``i``"""
+        return count / (size + self.sizes[i] - count)
+
+
+class LookupCache:
+    """Versioned in-process cache of the lookup tables
+
+    All four tables are loaded in one round trip and served from memory until
+    the TTL expires or ``invalidate`` is called after an admin write. Each
+    table's version is a fingerprint of its contents, so callers can key
+    derived data (rendered fragments, ETags) on it and every process serving
+    the same rows agrees on the same version.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._state = None
+        self._loaded_at = 0.0
+        self._derived = {}
+
+    def get(self, table):
+        """Return the cached names for one lookup table"""
+        return self.get_all()[table]
+
+    def get_all(self):
+        """Return a dict of table name -> list of names, loading it if stale
+
+        The lists are shared between requests and must not be mutated.
+        """
+        return self.snapshot()[0]
+
+    def version(self, table):
+        """Current version of a lookup table"""
+        return self.snapshot()[1][table]
+
+    def options(self, table):
+        """Rendered <option> elements for a lookup table's dropdown
+
+        The markup is built once per table version and reused by every page
+        that shows the dropdown, instead of being re-rendered per request.
+        """
+        return self._derive('options', table, lambda names: Markup(''.join(
+            f'<option value="{escape(name)}">{escape(name)}</option>\n' for name in names
+        )))
+
+    def suggest(self, table, query, limit=20):
+        """Names from a lookup table for a typeahead query
+
+        Prefix matches come first; when there aren't enough of them the rest
+        are filled with fuzzy matches, so a typo still finds the name.
+        """
+        results = self._derive('prefix', table, PrefixIndex).search(query, limit)
+        if len(results) < limit:
+            seen = set(results)
+            results += [name for name in self.match(table, query, limit) if name not in seen][:limit - len(results)]
+        return results
+
+    def match(self, table, query, limit=5):
+        """Names from a lookup table similar to ``query``, best match first"""
+        return self._trigrams(table).search(query, limit)
+
+    def resolve(self, table, name):
+        """The table's spelling of ``name``: itself if listed, else its closest match
+
+        Only a clear misspelling of one name is substituted; partial or
+        ambiguous names such as "MTH" or "Ali" are returned unchanged.
+        """
+        if not name or name in self._derive('names', table, frozenset):
+            return name
+        return self._trigrams(table).closest(name, RESOLVE_THRESHOLD, RESOLVE_MARGIN) or name
+
+    def _trigrams(self, table):
+        return self._derive('trigram', table, lambda names: TrigramIndex(names, FUZZY_THRESHOLD))
+
+    def _derive(self, kind, table, build):
+        """``build(names)`` for a table, rebuilt only when its version changes"""
+        values, versions = self.snapshot()
+        cached = self._derived.get((kind, table))
+        if cached is None or cached[0] != versions[table]:
+            cached = self._derived[(kind, table)] = (versions[table], build(values[table]))
+        return cached[1]
+
+    def snapshot(self):
+        """The cached (names, versions) pair, loading it if stale"""
+        state = self._state
+        if state is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return state
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if self._state is None or time.monotonic() - self._loaded_at >= self.ttl:
+                values = self._load()
+                versions = {table: fingerprint(names) for table, names in values.items()}
+                self._state = (values, versions)
+                self._loaded_at = time.monotonic()
+            return self._state
+
+    def invalidate(self, *tables):
+        """Drop the cached values so the next read reloads them"""
+        with self._lock:
+            self._state = None
+        logger.info(f"Lookup cache invalidated: {', '.join(tables or LOOKUP_TABLES)}")
+
+    def _load(self):
+        """Load every lookup table in a single query"""
+        query = ' UNION ALL '.join(
+            f"SELECT '{table}' AS tbl, id, name FROM {table}" for table in LOOKUP_TABLES
+        ) + ' ORDER BY tbl, id'
+
+        values = {table: [] for table in LOOKUP_TABLES}
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query)
+            for table, _, name in cursor.fetchall():
+                values[table].append(name)
+        logger.info("Lookup cache loaded: " + ', '.join(f"{t}={len(v)}" for t, v in values.items()))
+        return values
+
+
+# Fraction of a query's trigrams a name must share to count as a fuzzy match
+FUZZY_THRESHOLD = float(os.getenv('FUZZY_THRESHOLD', '0.5'))
+# Similarity a name given in a search filter or upload needs to be replaced,
+# and how far ahead of the next closest name it must be
+RESOLVE_THRESHOLD = float(os.getenv('FUZZY_RESOLVE_THRESHOLD', '0.6'))
+RESOLVE_MARGIN = float(os.getenv('FUZZY_RESOLVE_MARGIN', '0.1'))
+
+LOOKUP_CACHE = LookupCache(ttl=int(os.getenv('LOOKUP_CACHE_TTL', '300')))
@@ -0,0 +1,166 @@
+"""Versioned schema migrations
+
+init_db creates tables that don't exist yet; migrations change tables that
+already do. Each migration runs once, in order, and is recorded in
+schema_version. Indexes are built with CREATE INDEX CONCURRENTLY so a live
+deployment keeps serving reads and writes while they build, which means the
+runner works in autocommit mode and opens explicit transactions only around
+steps that need one.
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # list applied and pending migrations
+"""
+import argparse
+import logging
+import os
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for the advisory lock that serializes concurrent runners
+MIGRATION_LOCK_ID = 4827301
+
+
+@contextmanager
+def transaction(cursor):
+    """Explicit transaction on an autocommit connection"""
+    cursor.execute('BEGIN')
+    try:
+        yield
+    except Exception:
+        cursor.execute('ROLLBACK')
+        raise
+    cursor.execute('COMMIT')
+
+
+def create_index_concurrently(cursor, name, definition, unique=False):
+    """Build an index without blocking writes, replacing a leftover invalid one
+
+    A failed concurrent build leaves an INVALID index behind, which
+    IF NOT EXISTS would otherwise mistake for a finished one.
+    """
+    cursor.execute('''
+        SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s
+    ''', (name,))
+    row = cursor.fetchone()
+    if row and row[0]:
+        logger.warning(f"Dropping invalid index {name} left by an earlier run")
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+    cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}")
+
+
+def add_search_indexes(cursor):
+    # Equality filters first, then id for the keyset pagination ORDER BY id DESC
+    create_index_concurrently(cursor, 'files_course_filters_idx', 'files (course, year, semester, file_type, id)')
+    create_index_concurrently(cursor, 'files_term_idx', 'files (year, semester, id)')
+    create_index_concurrently(cursor, 'files_file_type_idx', 'files (file_type, id)')
+
+
+def add_reported_index(cursor):
+    # Only a handful of files are ever reported, so the index stays tiny
+    create_index_concurrently(cursor, 'files_reported_idx', 'files (id) WHERE reported')
+
+
+def add_unique_lookup_names(cursor):
+    with transaction(cursor):
+        # Point associations at the oldest of each set of duplicate professors;
+        # deleting the others cascades to their old file_professors rows
+        cursor.execute('''
+            WITH keep AS (
+                SELECT name, min(id) AS id FROM professors GROUP BY name HAVING count(*) > 1
+            )
+            INSERT INTO file_professors (file_id, professor_id)
+            SELECT fp.file_id, keep.id
+            FROM file_professors fp
+            JOIN professors p ON p.id = fp.professor_id
+            JOIN keep ON keep.name = p.name AND keep.id <> p.id
+            ON CONFLICT DO NOTHING
+        ''')
+        # files store course, semester and file type names, so no remapping is needed there
+        for table in ('professors', 'courses', 'semesters', 'file_types'):
+            cursor.execute(f'''
+                DELETE FROM {table} t USING {table} older
+                WHERE older.name = t.name AND older.id < t.id
+            ''')
+            if cursor.rowcount:
+                logger.info(f"Removed {cursor.rowcount} duplicate {table}")
+
+    # Named like the constraints init_db creates, so new databases skip these
+    for table in ('professors', 'courses', 'semesters', 'file_types'):
+        create_index_concurrently(cursor, f'{table}_name_key', f'{table} (name)', unique=True)
+
+
+# (version, description, migration) in the order they must run; never reorder or renumber
+MIGRATIONS = [
+    (1, 'composite indexes for the search filters', add_search_indexes),
+    (2, 'partial index on reported files', add_reported_index),
+    (3, 'unique lookup names', add_unique_lookup_names),
+]
+
+
+def applied_versions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    ''')
+    cursor.execute('SELECT version FROM schema_version')
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(CONNECTION_POOL):
+    """Apply pending migrations in order; returns the versions applied"""
+    conn = CONNECTION_POOL.getconn()
+    conn.autocommit = True
+    try:
+        cursor = conn.cursor()
+        # Another instance deploying at the same time waits here rather than racing
+        cursor.execute('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_ID,))
+        try:
+            done = applied_versions(cursor)
+            applied = []
+            for version, description, migration in MIGRATIONS:
+                if version in done:
+                    continue
+                logger.info(f"Applying migration {version}: {description}")
+                migration(cursor)
+                cursor.execute('INSERT INTO schema_version (version, description) VALUES (%s, %s)',
+                               (version, description))
+                applied.append(version)
+            return applied
+        finally:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_ID,))
+    finally:
+        conn.autocommit = False
+        CONNECTION_POOL.putconn(conn)
+
+
+def main():
+    from dotenv import load_dotenv
+    from db import ConnectionPool
+
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('--status', action='store_true', help='list migrations without applying them')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv("lock.env")
+    CONNECTION_POOL = ConnectionPool(os.getenv('DATABASE_URL'), 1, 1)
+    try:
+        if args.status:
+            with CONNECTION_POOL.connection() as conn:
+                done = applied_versions(conn.cursor())
+            for version, description, _ in MIGRATIONS:
+                print(f"{version:>4}  {'applied' if version in done else 'pending':8} {description}")
+        else:
+            applied = migrate(CONNECTION_POOL)
+            print(f"Applied migrations: {applied}" if applied else 'Schema is up to date')
+    finally:
+        CONNECTION_POOL.closeall()
+
+
+if __name__ == '__main__':
+    main()
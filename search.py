@@ -0,0 +1,153 @@
+import base64
+import binascii
+import os
+import re
+
+from db import get_db
+from lookups import LOOKUP_CACHE
+
+# Columns rendered by templates/search.html, in tuple order
+SEARCH_COLUMNS = ('id', 'filename', 'course', 'profs', 'year', 'semester', 'file_type', 'file_ID', 'file_link', 'reported')
+
+DEFAULT_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '25'))
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(last_id):
+    """Encode the last id of a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor back to the id to continue after, raising ValueError if invalid"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        prefix, _, last_id = base64.urlsafe_b64decode(padded).decode().partition(':')
+        if prefix != 'id':
+            raise ValueError
+        return int(last_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_page_size(value):
+    """Clamp a requested page size to [1, MAX_PAGE_SIZE]"""
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def _filter_clause(course='', profs=None, file_type='', year='', semester=''):
+    """Build the WHERE conditions shared by the filtered and ranked searches
+
+    Course and professor names are mapped onto the catalog's spelling first,
+    so a near miss from the API or a pasted link still filters correctly.
+    """
+    clause = ''
+    values = []
+    course = LOOKUP_CACHE.resolve('courses', course)
+    profs = [LOOKUP_CACHE.resolve('professors', prof) for prof in profs or ()]
+
+    if course:
+        clause += ' AND course=%s'
+        values.append(course)
+
+    if profs:
+        clause += '''
+            AND id IN (
+                SELECT fp.file_id FROM file_professors fp
+                JOIN professors p ON p.id = fp.professor_id
+                WHERE p.name = ANY(%s)
+            )'''
+        values.append(list(profs))
+
+    if year:
+        clause += ' AND year=%s'
+        values.append(year)
+
+    if semester:
+        clause += ' AND semester=%s'
+        values.append(semester)
+
+    if file_type:
+        clause += ' AND file_type=%s'
+        values.append(file_type)
+
+    return clause, values
+
+
+def search_files(course='', profs=None, file_type='', year='', semester='', cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Run a filtered search over files, newest first, one page at a time
+
+    Uses keyset pagination on ``id`` so every page costs the same no matter how
+    deep into the results it is. Returns ``(rows, next_cursor)``, where
+    ``next_cursor`` is None on the last page.
+    """
+    clause, search_values = _filter_clause(course, profs, file_type, year, semester)
+    query = f"SELECT {', '.join(SEARCH_COLUMNS)} FROM files WHERE 1=1" + clause
+
+    if cursor:
+        query += ' AND id < %s'
+        search_values.append(decode_cursor(cursor))
+
+    # Fetch one extra row to find out whether there is a next page
+    query += ' ORDER BY id DESC LIMIT %s'
+    search_values.append(page_size + 1)
+
+    with get_db() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(query, search_values)
+        rows = db_cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1][0])
+    return rows, next_cursor
+
+
+def to_prefix_tsquery(text):
+    """Turn free text into a tsquery matching every word as a prefix
+
+    "calc midterm" becomes ``calc:* & midterm:*`` so partial words still match.
+    """
+    return ' & '.join(f"{token}:*" for token in re.findall(r'\w+', text.lower()))
+
+
+def rank_files(q, course='', profs=None, file_type='', year='', semester='', limit=DEFAULT_PAGE_SIZE):
+    """Free-text search over filenames, courses and professors, best match first
+
+    Matches go through the GIN index on ``files.search_vector``. Partial course
+    codes such as "MTH 10" also match via ILIKE, which the trigram index on
+    ``course`` serves when pg_trgm is installed. Misspelled course and
+    professor names match through the in-memory trigram indexes, ranked after
+    the exact matches.
+    """
+    tsquery = to_prefix_tsquery(q)
+    if not tsquery:
+        return []
+
+    pattern = '%' + re.sub(r'([\\%_])', r'\\\1', q.strip()) + '%'
+    clause, filter_values = _filter_clause(course, profs, file_type, year, semester)
+    query = f'''
+        SELECT {', '.join(SEARCH_COLUMNS)}
+        FROM files, to_tsquery('simple', %s) AS query
+        WHERE (
+            search_vector @@ query OR course ILIKE %s OR course = ANY(%s)
+            OR id IN (
+                SELECT fp.file_id FROM file_professors fp
+                JOIN professors p ON p.id = fp.professor_id
+                WHERE p.name = ANY(%s)
+            )
+        ){clause}
+        ORDER BY ts_rank(search_vector, query) DESC, id DESC
+        LIMIT %s
+    '''
+
+    with get_db() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(query, [tsquery, pattern, LOOKUP_CACHE.match('courses', q),
+                                  LOOKUP_CACHE.match('professors', q)] + filter_values + [limit])
+        return db_cursor.fetchall()
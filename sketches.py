@@ -0,0 +1,135 @@
+import hashlib
+import math
+import threading
+from array import array
+from collections import deque
+
+
+def _hash64(value, salt=b''):
+    """Stable 64-bit hash of a string (Python's hash() is randomized per process)"""
+    digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8, salt=salt).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class RingBuffer:
+    """Fixed-size buffer of the most recent items"""
+
+    def __init__(self, size=100):
+        self._items = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def append(self, item):
+        with self._lock:
+            self._items.append(item)
+
+    def snapshot(self):
+        """Items from oldest to newest"""
+        with self._lock:
+            return list(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class HyperLogLog:
+    """Approximate distinct counter in 2**precision bytes
+
+    With the default precision of 12 (4 KB) the standard error is about 1.6%.
+    """
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.m = 1 << precision
+        self._registers = bytearray(self.m)
+        self._lock = threading.Lock()
+        if self.m >= 128:
+            self._alpha = 0.7213 / (1 + 1.079 / self.m)
+        else:
+            self._alpha = {16: 0.673, 32: 0.697, 64: 0.709}[self.m]
+
+    def add(self, value):
+        h = _hash64(value)
+        index = h >> (64 - self.precision)
+        rest = (h << self.precision) & 0xFFFFFFFFFFFFFFFF
+        # Position of the first set bit in the remaining bits
+        rank = min(64 - self.precision, 64 - rest.bit_length()) + 1
+        with self._lock:
+            if rank > self._registers[index]:
+                self._registers[index] = rank
+
+    def count(self):
+        with self._lock:
+            registers = bytes(self._registers)
+        estimate = self._alpha * self.m * self.m / sum(2.0 ** -r for r in registers)
+        zeros = registers.count(0)
+        # Small range correction: fall back to linear counting
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+
+class CountMinSketch:
+    """Approximate frequency counter with fixed width * depth counters
+
+    Estimates never undercount; they overcount by at most ``e / width`` of the
+    total with probability ``1 - e ** -depth``.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._rows = [array('Q', bytes(8 * width)) for _ in range(depth)]
+        self._lock = threading.Lock()
+
+    def _indexes(self, value):
+        # Double hashing: depth independent-enough indexes from two hashes
+        h1 = _hash64(value)
+        h2 = _hash64(value, salt=b'cms') | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, value, count=1):
+        """Add to a value's count and return its new estimate"""
+        indexes = self._indexes(value)
+        with self._lock:
+            self.total += count
+            estimate = None
+            for row, index in zip(self._rows, indexes):
+                row[index] += count
+                estimate = row[index] if estimate is None else min(estimate, row[index])
+            return estimate
+
+    def estimate(self, value):
+        indexes = self._indexes(value)
+        with self._lock:
+            return min(row[index] for row, index in zip(self._rows, indexes))
+
+
+class TopK:
+    """Heavy hitters: a Count-Min sketch plus the k values with the highest estimates"""
+
+    def __init__(self, k=10, width=2048, depth=4):
+        self.k = k
+        self._sketch = CountMinSketch(width, depth)
+        self._top = {}
+        self._lock = threading.Lock()
+
+    def add(self, value, count=1):
+        estimate = self._sketch.add(value, count)
+        with self._lock:
+            if value in self._top or len(self._top) < self.k:
+                self._top[value] = estimate
+                return
+            smallest = min(self._top, key=self._top.get)
+            if estimate > self._top[smallest]:
+                del self._top[smallest]
+                self._top[value] = estimate
+
+    def top(self):
+        """List of (value, approximate count), highest first"""
+        with self._lock:
+            return sorted(self._top.items(), key=lambda item: item[1], reverse=True)
+
+    @property
+    def total(self):
+        return self._sketch.total
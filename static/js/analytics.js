@@ -1,8 +1,17 @@
 /**
  * Analytics tracking for AUS Archive
  * Handles page view tracking and other analytics events
+ *
+ * Events are buffered and sent together to the batch endpoint, on an
+ * interval and when the page is hidden or unloaded.
  */
 
+const ANALYTICS_BATCH_URL = "/analytics/api/analytics/record-batch";
+const ANALYTICS_FLUSH_INTERVAL = 10000; // ms
+const ANALYTICS_MAX_BUFFER = 20;
+
+let analyticsBuffer = [];
+
 document.addEventListener("DOMContentLoaded", function () {
 	// Track page view
 	const currentPage = window.location.pathname;
@@ -10,19 +19,51 @@ document.addEventListener("DOMContentLoaded", function () {
 
 	// Set up event listeners for tracking interactions
 	setupEventTracking();
+
+	// Flush periodically and whenever the page may be going away
+	setInterval(flushAnalytics, ANALYTICS_FLUSH_INTERVAL);
+	document.addEventListener("visibilitychange", function () {
+		if (document.visibilityState === "hidden") {
+			flushAnalytics();
+		}
+	});
+	window.addEventListener("pagehide", flushAnalytics);
 });
 
 /**
- * Track a page view
- * @param {string} page - The page path to track
+ * Add an event to the buffer, flushing early if it is full
+ * @param {Object} event - The event to buffer
  */
-function trackPageView(page) {
-	fetch("/analytics/api/analytics/record-view", {
+function queueAnalyticsEvent(event) {
+	analyticsBuffer.push(event);
+	if (analyticsBuffer.length >= ANALYTICS_MAX_BUFFER) {
+		flushAnalytics();
+	}
+}
+
+/**
+ * Send all buffered events in a single request
+ */
+function flushAnalytics() {
+	if (!analyticsBuffer.length) {
+		return;
+	}
+
+	const body = JSON.stringify({ events: analyticsBuffer });
+	analyticsBuffer = [];
+
+	// sendBeacon survives page unloads; fall back to a keepalive fetch
+	const blob = new Blob([body], { type: "application/json" });
+	if (navigator.sendBeacon && navigator.sendBeacon(ANALYTICS_BATCH_URL, blob)) {
+		return;
+	}
+
+	fetch(ANALYTICS_BATCH_URL, {
 		method: "POST",
 		headers: {
 			"Content-Type": "application/json",
 		},
-		body: JSON.stringify({ page: page }),
+		body: body,
 		// Use non-blocking request
 		keepalive: true,
 	}).catch((error) => {
@@ -31,6 +72,14 @@ function trackPageView(page) {
 	});
 }
 
+/**
+ * Track a page view
+ * @param {string} page - The page path to track
+ */
+function trackPageView(page) {
+	queueAnalyticsEvent({ type: "view", page: page });
+}
+
 /**
  * Set up event listeners for tracking user interactions
  */
@@ -43,13 +92,11 @@ function setupEventTracking() {
 			const linkText = this.innerText || "external link";
 
 			// Track external link click
-			navigator.sendBeacon(
-				"/analytics/api/analytics/record-event",
-				JSON.stringify({
-					event_type: "external_link",
-					event_data: { url, linkText },
-				})
-			);
+			queueAnalyticsEvent({
+				type: "event",
+				event_type: "external_link",
+				event_data: { url, linkText },
+			});
 		});
 	});
 
@@ -60,13 +107,11 @@ function setupEventTracking() {
 			const fileName = this.getAttribute("data-file-name") || "unknown";
 
 			// Track file download
-			navigator.sendBeacon(
-				"/analytics/api/analytics/record-event",
-				JSON.stringify({
-					event_type: "file_download",
-					event_data: { fileId, fileName },
-				})
-			);
+			queueAnalyticsEvent({
+				type: "event",
+				event_type: "file_download",
+				event_data: { fileId, fileName },
+			});
 		});
 	});
 }
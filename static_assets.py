@@ -0,0 +1,131 @@
+"""Fingerprinted, precompressed static files
+
+``url_for('static', filename='styles.css')`` is rewritten to
+``/static/styles.<digest>.css``, where the digest is taken from the file's
+contents. A fingerprinted URL never changes meaning, so it is served with a
+one-year immutable Cache-Control and repeat page loads make no static
+requests at all; editing a file changes its URL instead. Text assets are
+compressed once per version, gzip or brotli depending on Accept-Encoding, and
+kept in memory, since the deployed static folder is read-only.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+
+from flask import current_app, request, send_from_directory
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+from compression import COMPRESSIBLE_TYPES, choose_encoding, compress
+
+logger = logging.getLogger(__name__)
+
+# Length of the content digest embedded in fingerprinted file names
+DIGEST_LENGTH = 10
+HASHED_NAME = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{%d})(?P<ext>\.[^./]+)$' % DIGEST_LENGTH)
+
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def hashed_name(filename, digest):
+    """``styles.css`` -> ``styles.<digest>.css``"""
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{digest}{ext}"
+
+
+class StaticAssets:
+    """Fingerprints static files for URLs and serves them with long-lived caching
+
+    Digests are computed on first use and recomputed when a file's size or
+    modification time changes, so nothing is read at startup.
+    """
+
+    def __init__(self, max_age=ONE_YEAR, min_size=512):
+        self.max_age = max_age
+        self.min_size = min_size
+        self.folder = None
+        self._digests = {}
+        self._variants = {}
+
+    def init_app(self, app):
+        self.folder = app.static_folder
+        app.url_defaults(self.fingerprint_url)
+        # Serve the built-in static endpoint through the fingerprint-aware view too
+        app.view_functions['static'] = self.send
+
+    def digest(self, filename):
+        """Content digest of a static file, or None if there is no such file"""
+        path = safe_join(self.folder, filename)
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            stat = None
+        if stat is None or not os.path.isfile(path):
+            return None
+
+        cached = self._digests.get(filename)
+        if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:DIGEST_LENGTH]
+            cached = self._digests[filename] = (stat.st_mtime_ns, stat.st_size, digest)
+        return cached[2]
+
+    def fingerprint_url(self, endpoint, values):
+        """url_defaults hook adding the content digest to static file names"""
+        if endpoint in ('static', 'static_files') and 'filename' in values:
+            digest = self.digest(values['filename'])
+            if digest:
+                values['filename'] = hashed_name(values['filename'], digest)
+
+    def send(self, filename):
+        """Serve a static file, fingerprinted or not"""
+        immutable = False
+        match = HASHED_NAME.match(filename)
+        if match and self.digest(filename) is None:
+            filename = match['stem'] + match['ext']
+            # A page from before the file changed still gets the current
+            # version, just without the promise that it never changes
+            immutable = self.digest(filename) == match['digest']
+
+        digest = self.digest(filename)
+        if digest is None:
+            raise NotFound()
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        compressible = mimetype.startswith(COMPRESSIBLE_TYPES)
+        encoding = choose_encoding(request.accept_encodings) if compressible else None
+        body = self._variant(filename, digest, encoding) if encoding else None
+
+        if body is None:
+            response = send_from_directory(self.folder, filename, max_age=self.max_age if immutable else None)
+        else:
+            response = current_app.response_class(body, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            response.set_etag(f"{digest}-{encoding}")
+            if not immutable:
+                response.cache_control.no_cache = True
+            response.make_conditional(request)
+
+        if compressible:
+            response.vary.add('Accept-Encoding')
+        if immutable:
+            response.cache_control.public = True
+            response.cache_control.max_age = self.max_age
+            response.cache_control.immutable = True
+        return response
+
+    def _variant(self, filename, digest, encoding):
+        """Compressed bytes of one version of a file, or None if not worth it"""
+        key = (filename, digest, encoding)
+        if key not in self._variants:
+            with open(safe_join(self.folder, filename), 'rb') as f:
+                data = f.read()
+            body = compress(data, encoding) if len(data) >= self.min_size else None
+            # Keep the original when compression doesn't pay for itself
+            self._variants[key] = body if body is not None and len(body) < len(data) else None
+        return self._variants[key]
+
+
+STATIC_ASSETS = StaticAssets(max_age=int(os.getenv('STATIC_MAX_AGE', str(ONE_YEAR))))
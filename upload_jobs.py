@@ -0,0 +1,341 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import Json, execute_values
+
+from analytics_core import record_upload
+from db import find_file_by_hash, get_db, insert_files
+from drive import google_delete, google_retrieve_links, google_share, google_upload
+
+logger = logging.getLogger(__name__)
+
+# Where uploads wait on local disk until a worker sends them to Drive
+STAGING_DIR = os.getenv('UPLOAD_STAGING_DIR', os.path.join(tempfile.gettempdir(), 'aus-archive-uploads'))
+
+# Read size when copying an upload to the staging directory
+STAGE_CHUNK_SIZE = 64 * 1024
+
+# Columns a worker may update on its job row
+JOB_FIELDS = ('status', 'drive_file_id', 'file_link', 'file_id', 'error')
+
+
+def stage_upload(file):
+    """Copy an uploaded file to the staging directory, hashing it on the way
+
+    Returns the staged path and the SHA-256 hex digest of the content.
+    """
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    staged_path = os.path.join(STAGING_DIR, uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    file.stream.seek(0)
+    with open(staged_path, 'wb') as staged:
+        for chunk in iter(lambda: file.stream.read(STAGE_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            staged.write(chunk)
+    return staged_path, digest.hexdigest()
+
+
+def discard_staged(staged_path):
+    try:
+        os.remove(staged_path)
+    except OSError:
+        pass
+
+
+class UploadJobs:
+    """Background upload jobs backed by the upload_jobs table
+
+    The request handler stages each file on local disk (see ``stage_upload``)
+    and records pending jobs, one per file. Files submitted together form a
+    batch: a coordinator thread hands their Drive uploads and sharing grants to
+    a bounded pool of transfer threads, then inserts every finished file with
+    a single multi-row INSERT. Each step is retried with exponential backoff
+    and its progress saved on the job row, so a retried or resumed job never
+    uploads the same file to Drive twice.
+
+    Coordinators run on their own small executor: if they shared the transfer
+    pool, a few batches waiting on their transfers could starve it.
+
+    With ``background`` off, a batch runs to completion inside the request
+    that submitted it instead, for hosts that freeze or discard the process
+    once the response is sent.
+    """
+
+    def __init__(self, max_workers=4, max_batches=2, max_attempts=3, retry_delay=1.0, stale_after=1800,
+                 background=True):
+        self.max_workers = max_workers
+        self.max_batches = max_batches
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.stale_after = stale_after
+        self.background = background
+        self._app = None
+        self._transfers = None
+        self._coordinators = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Run jobs through the app's connection pool"""
+        self._app = app
+        if not self.background:
+            logger.warning("Upload jobs run inside the request: no persistent staging directory on this host")
+
+    def submit(self, staged_path, original_name, metadata):
+        """Queue a job for a staged upload, returning the job id
+
+        ``metadata`` holds the target filename, mimetype, content hash and the
+        files row fields (course, prof_names, year, semester, file_type,
+        uploaded_by, user_id).
+        """
+        return self.submit_batch([(staged_path, original_name, metadata)])[0]
+
+    def submit_batch(self, uploads):
+        """Queue one batch of (staged_path, original_name, metadata) uploads, returning their job ids"""
+        job_ids = [uuid.uuid4().hex for _ in uploads]
+        try:
+            with get_db() as conn:
+                cursor = conn.cursor()
+                execute_values(cursor, '''
+                    INSERT INTO upload_jobs (id, staged_path, original_name, metadata) VALUES %s
+                ''', [
+                    (job_id, staged_path, original_name, Json(metadata))
+                    for job_id, (staged_path, original_name, metadata) in zip(job_ids, uploads)
+                ], page_size=len(uploads))
+        except Exception:
+            for staged_path, _, _ in uploads:
+                discard_staged(staged_path)
+            raise
+
+        if self.background:
+            self._get_executors()[1].submit(self.run_batch, job_ids)
+        else:
+            self.run_batch(job_ids)
+        return job_ids
+
+    def status(self, job_id):
+        """Current state of a job, or None if it doesn't exist"""
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT status, error, file_link, metadata->>'uploaded_by', original_name
+                FROM upload_jobs WHERE id = %s
+            ''', (job_id,))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        status, error, file_link, uploaded_by, original_name = row
+        return {
+            'job_id': job_id,
+            'status': status,
+            'error': error,
+            'file_link': file_link if status in ('done', 'duplicate') else None,
+            'filename': original_name,
+            'uploaded_by': uploaded_by
+        }
+
+    def run(self, job_id):
+        """Run a single pending job to completion"""
+        self.run_batch([job_id])
+
+    def run_batch(self, job_ids):
+        """Run pending jobs to completion; safe to call from several processes"""
+        pool = self._app.config['CONNECTION_POOL']
+
+        # Claim the jobs atomically so each only ever runs once at a time
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE upload_jobs SET status = 'running', attempts = attempts + 1, updated_at = now()
+                WHERE id = ANY(%s) AND status = 'pending'
+                RETURNING id, staged_path, metadata, drive_file_id, file_link
+            ''', (list(job_ids),))
+            jobs = cursor.fetchall()
+        if not jobs:
+            return
+
+        start = time.perf_counter()
+        transfers = self._get_executors()[0]
+        futures = [(job, transfers.submit(self._transfer, *job)) for job in jobs]
+        ready = []
+        for job, future in futures:
+            result = future.result()
+            if result is not None:
+                ready.append((job, result))
+        if not ready:
+            return
+
+        def save():
+            with pool.connection() as conn:
+                cursor = conn.cursor()
+                file_ids = insert_files(cursor, [
+                    dict(metadata, file_ID=drive_file_id, file_link=file_link)
+                    for (_, _, metadata, _, _), (drive_file_id, file_link) in ready
+                ])
+                done = [(job[0], file_id) for (job, _), file_id in zip(ready, file_ids) if file_id]
+                if done:
+                    execute_values(cursor, '''
+                        UPDATE upload_jobs SET status = 'done', file_id = v.file_id, error = NULL, updated_at = now()
+                        FROM (VALUES %s) AS v (id, file_id) WHERE upload_jobs.id = v.id
+                    ''', done, page_size=len(done))
+                # Rows skipped because an identical file got in first
+                return [
+                    (job, result, find_file_by_hash(cursor, job[2]['content_hash']))
+                    for (job, result), file_id in zip(ready, file_ids) if file_id is None
+                ]
+
+        try:
+            duplicates = self._retry(save, 'database insert')
+        except Exception as e:
+            logger.error(f"Upload batch of {len(ready)} files failed to save: {e}")
+            for (job_id, staged_path, _, _, _), _ in ready:
+                self._update(job_id, status='failed', error=str(e))
+                discard_staged(staged_path)
+            return
+
+        duplicate_ids = set()
+        for (job_id, staged_path, _, _, _), (drive_file_id, _), existing in duplicates:
+            # Lost a race with an identical upload; its public Drive copy is not needed
+            logger.warning(f"Upload job {job_id} duplicated file {existing[0]}, deleting Drive file {drive_file_id}")
+            self._delete_drive_copy(job_id, drive_file_id)
+            self._finish_duplicate(job_id, staged_path, existing)
+            duplicate_ids.add(job_id)
+
+        elapsed = time.perf_counter() - start
+        for (job_id, staged_path, metadata, _, _), _ in ready:
+            if job_id in duplicate_ids:
+                continue
+            discard_staged(staged_path)
+            logger.info(f"Upload job {job_id} done in {elapsed:.2f}s: "
+                        f"{metadata['course']}, {metadata['file_type']}, by: {metadata['uploaded_by']}")
+
+            # Record upload in analytics
+            record_upload({
+                'course': metadata['course'],
+                'file_type': metadata['file_type'],
+                'professor': ', '.join(metadata['prof_names']),
+                'year': metadata['year'],
+                'semester': metadata['semester']
+            }, user={'user_id': metadata.get('user_id'), 'user_email': metadata['uploaded_by']})
+
+    def _transfer(self, job_id, staged_path, metadata, drive_file_id, file_link):
+        """Upload and share one job's file, returning (drive_file_id, file_link)
+
+        Returns None if the job already ended here, as a duplicate or a failure.
+        """
+        try:
+            if drive_file_id is None:
+                # An identical file may have been added since the job was queued
+                with self._app.config['CONNECTION_POOL'].connection() as conn:
+                    existing = find_file_by_hash(conn.cursor(), metadata.get('content_hash'))
+                if existing:
+                    self._finish_duplicate(job_id, staged_path, existing)
+                    return None
+
+                def upload():
+                    with open(staged_path, 'rb') as stream:
+                        return google_upload(stream, metadata['filename'], metadata['mimetype'])
+                drive_file_id, web_link = self._retry(upload, 'Drive upload')
+                self._update(job_id, drive_file_id=drive_file_id)
+
+                # file_link is only saved once the file is shared
+                self._retry(lambda: google_share(drive_file_id), 'sharing')
+                file_link = web_link
+                self._update(job_id, file_link=file_link)
+            elif file_link is None:
+                # Resumed after the upload: the link from the create call is gone
+                file_link = self._retry(lambda: google_retrieve_links(drive_file_id), 'sharing link')
+                self._update(job_id, file_link=file_link)
+            return drive_file_id, file_link
+        except Exception as e:
+            logger.error(f"Upload job {job_id} failed: {e}")
+            self._update(job_id, status='failed', error=str(e))
+            if drive_file_id is not None:
+                # Uploaded but never recorded; nothing would ever point at it
+                self._delete_drive_copy(job_id, drive_file_id)
+            discard_staged(staged_path)
+            return None
+
+    def resume_pending(self):
+        """Requeue pending jobs and jobs whose worker died mid-run"""
+        with self._app.config['CONNECTION_POOL'].connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE upload_jobs SET status = 'pending', updated_at = now()
+                WHERE status = 'running' AND updated_at < now() - %s * interval '1 second'
+            ''', (self.stale_after,))
+            cursor.execute("SELECT id FROM upload_jobs WHERE status = 'pending' ORDER BY created_at")
+            job_ids = [row[0] for row in cursor.fetchall()]
+
+        if job_ids:
+            self._get_executors()[1].submit(self.run_batch, job_ids)
+            logger.info(f"Resumed {len(job_ids)} pending upload jobs")
+
+    def _retry(self, step, name):
+        """Run a step, retrying with exponential backoff"""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return step()
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    raise
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                logger.warning(f"{name} failed (attempt {attempt}/{self.max_attempts}), retrying in {delay}s: {e}")
+                time.sleep(delay)
+
+    def _update(self, job_id, **fields):
+        assert set(fields) <= set(JOB_FIELDS)
+        assignments = ', '.join(f"{name} = %s" for name in fields)
+        with self._app.config['CONNECTION_POOL'].connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"UPDATE upload_jobs SET {assignments}, updated_at = now() WHERE id = %s",
+                           list(fields.values()) + [job_id])
+
+    def _delete_drive_copy(self, job_id, drive_file_id):
+        """Best-effort removal of an uploaded file that won't get a files row"""
+        try:
+            self._retry(lambda: google_delete(drive_file_id), 'Drive delete')
+        except Exception as e:
+            logger.error(f"Upload job {job_id} could not delete Drive file {drive_file_id}: {e}")
+
+    def _finish_duplicate(self, job_id, staged_path, existing):
+        file_id, file_link = existing
+        logger.info(f"Upload job {job_id} is a duplicate of file {file_id}")
+        self._update(job_id, status='duplicate', file_id=file_id, file_link=file_link)
+        discard_staged(staged_path)
+
+    def _get_executors(self):
+        """(transfer pool, coordinator pool) for this process"""
+        # Threads don't survive a fork, so a pre-forking server needs pools per worker
+        if self._transfers is not None and self._pid == os.getpid():
+            return self._transfers, self._coordinators
+        with self._lock:
+            if self._transfers is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._transfers = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='upload-transfer')
+                self._coordinators = ThreadPoolExecutor(max_workers=self.max_batches, thread_name_prefix='upload-batch')
+                if self.background:
+                    self._coordinators.submit(self._resume_safely)
+            return self._transfers, self._coordinators
+
+    def _resume_safely(self):
+        try:
+            self.resume_pending()
+        except Exception as e:
+            logger.error(f"Failed to resume pending upload jobs: {e}")
+
+
+UPLOAD_JOBS = UploadJobs(
+    max_workers=int(os.getenv('UPLOAD_WORKERS', '4')),
+    max_batches=int(os.getenv('UPLOAD_BATCHES', '2')),
+    max_attempts=int(os.getenv('UPLOAD_MAX_ATTEMPTS', '3')),
+    # Serverless functions on Vercel stop when the response is sent and keep
+    # nothing in /tmp, so jobs can only run in the background with real staging
+    background=not (os.getenv('VERCEL_ENV') and not os.getenv('UPLOAD_STAGING_DIR'))
+)